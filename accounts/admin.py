@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, Experiment, SessionBooking
+from .models import User, Experiment, SessionBooking, WaitlistEntry, Notification, AuditEvent
 
 # Register User model with custom admin
 @admin.register(User)
@@ -20,9 +20,41 @@ class ExperimentAdmin(admin.ModelAdmin):
 # Register SessionBooking model
 @admin.register(SessionBooking)
 class SessionBookingAdmin(admin.ModelAdmin):
-    list_display = ['user', 'experiment', 'start_time', 'end_time', 'status', 'created_at']
+    list_display = ['user', 'experiment', 'start_time', 'end_time', 'status', 'prewarm_status', 'created_at']
     list_filter = ['status', 'experiment', 'created_at']
     search_fields = ['user__username', 'experiment__name']
     date_hierarchy = 'start_time'
     readonly_fields = ['created_at']
 
+# Register WaitlistEntry model
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ['user', 'experiment', 'window_start', 'window_end', 'duration', 'status', 'created_at']
+    list_filter = ['status', 'experiment']
+    search_fields = ['user__username', 'experiment__name']
+    readonly_fields = ['created_at']
+
+# Register Notification model
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ['user', 'kind', 'booking', 'status', 'attempts', 'created_at', 'sent_at']
+    list_filter = ['kind', 'status']
+    search_fields = ['user__username', 'user__email']
+    readonly_fields = ['created_at', 'sent_at']
+
+# Register AuditEvent model (read-only: the trail is append-only)
+@admin.register(AuditEvent)
+class AuditEventAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'kind', 'user_id', 'exp_key', 'booking_id']
+    list_filter = ['kind', 'exp_key']
+    date_hierarchy = 'created_at'
+    readonly_fields = ['created_at', 'kind', 'user_id', 'exp_key', 'booking_id', 'data']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,125 @@
+"""Async counterparts of the slow-I/O endpoints in views.py.
+
+These are routed instead of the sync views when ``ASYNC_VIEWS`` is enabled,
+i.e. when the project is served through ``project_login.asgi`` by an ASGI
+server. With ``RESTART_RUNNER = 'inline'`` restarts run as tasks on the
+server's event loop, so these views must not be used under WSGI where each
+request gets a throwaway loop.
+"""
+import asyncio
+import logging
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.shortcuts import aget_object_or_404, redirect
+from django.utils import timezone
+from django.views.decorators.http import require_GET, require_POST
+
+from . import audit
+from .ratelimit import RateLimited, enforce, rate_limit
+from .holds import mark_held_slots
+from .models import Experiment, SessionBooking
+from .services import SERVICE_MAP, aprobe_services, schedule_restart, service_status_payload
+from .slots import build_slots, overlapping_bookings, slot_window_start
+
+logger = logging.getLogger(__name__)
+
+
+@login_required
+@rate_limit('slots')
+async def get_available_slots(request):
+    """API endpoint to return available slots for an experiment (JSON)."""
+    exp_key = request.GET.get('exp')
+    date_str = request.GET.get('date')
+    duration = int(request.GET.get('duration', 60))
+
+    if not exp_key:
+        return JsonResponse({'error': 'Missing experiment'}, status=400)
+
+    experiment = await aget_object_or_404(Experiment, exp_key=exp_key)
+    user = await request.auser()
+
+    current = slot_window_start(date_str)
+    bookings = [b async for b in overlapping_bookings(experiment, current, duration)]
+    slots = build_slots(current, duration, bookings, user.id)
+    await sync_to_async(mark_held_slots)(slots, exp_key, current, duration, user.id)
+
+    return JsonResponse({'slots': slots})
+
+
+@login_required
+@require_POST
+async def trigger_service(request):
+    """Trigger restart for a mapped experiment (only via POST)."""
+    exp = request.POST.get("exp")
+    if not exp or exp not in SERVICE_MAP:
+        return HttpResponseBadRequest("Invalid experiment selection.")
+
+    entry = SERVICE_MAP[exp]
+    user = await request.auser()
+
+    # Only a restart that really starts (not one already running) is charged to the restart limits
+    try:
+        started = await schedule_restart(exp, before_start=partial(enforce, 'restart', user.pk, exp))
+    except RateLimited as limited:
+        return limited.response()
+    if started:
+        audit.record('restart_requested', user=user, exp_key=exp)
+        logger.info("User %s triggered restart for %s", user.username, exp)
+    else:
+        logger.warning("No restart plan and restart script missing or not executable for %s: %s", exp, entry.get("script"))
+
+    return redirect(entry["url"])
+
+
+@login_required
+async def start_experiment(request, booking_id):
+    """Allow user to start an active experiment session and trigger restart."""
+    user = await request.auser()
+    booking = await aget_object_or_404(
+        SessionBooking.objects.select_related('experiment'), id=booking_id, user=user
+    )
+    now = timezone.now()
+
+    # Verify session is active and within time window
+    if not (booking.start_time <= now < booking.end_time) or booking.status != 'active':
+        return HttpResponseBadRequest("Booking is not currently active.")
+
+    exp = booking.experiment
+    if booking.is_warm:
+        # Pre-warm scheduler already readied the testbed for this slot
+        logger.info("Booking %s starts on a pre-warmed testbed (user: %s)", booking_id, user.username)
+        return redirect(exp.full_url)
+
+    try:
+        started = await schedule_restart(exp.exp_key, before_start=partial(enforce, 'restart', user.pk, exp.exp_key))
+    except RateLimited as limited:
+        return limited.response()
+    if started:
+        audit.record('restart_requested', user=user, exp_key=exp.exp_key, booking=booking)
+        logger.info("Restart triggered for booking %s (user: %s)", booking_id, user.username)
+
+    # Redirect to experiment UI
+    return redirect(exp.full_url)
+
+
+@require_GET
+async def health(request):
+    """Liveness probe for load balancers and process managers."""
+    return JsonResponse({'status': 'ok'})
+
+
+@login_required
+@require_GET
+async def service_status(request):
+    """Report reachability and last restart state of every mapped testbed (restart details for staff)."""
+    user = await request.auser()
+    reachable = await aprobe_services()
+    # Restart state may need a coordinator lookup (file lock/SQLite/Redis): keep it off the loop
+    payloads = await asyncio.gather(*(
+        sync_to_async(service_status_payload, thread_sensitive=False)(k, r, detail=user.is_staff)
+        for k, r in reachable.items()
+    ))
+    return JsonResponse({'services': dict(zip(reachable, payloads))})
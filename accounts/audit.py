@@ -0,0 +1,158 @@
+"""Append-only audit trail of bookings and testbed restarts.
+
+``record`` only appends a dict to an in-memory buffer, so the request path
+never waits on the database. A background thread (one per process, started
+lazily so it works under pre-fork servers) turns the buffer into
+``AuditEvent`` rows with one ``bulk_create`` every ``AUDIT_FLUSH_SECONDS``
+or ``AUDIT_BATCH_SIZE`` events, whichever comes first. If the insert fails,
+the batch is appended to a JSONL segment under ``AUDIT_SPILL_DIR`` and
+loaded again after the next successful flush.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .db import run_write
+from .models import AuditEvent
+
+logger = logging.getLogger(__name__)
+
+
+def batch_size():
+    return getattr(settings, 'AUDIT_BATCH_SIZE', 500)
+
+
+def flush_interval():
+    return getattr(settings, 'AUDIT_FLUSH_SECONDS', 1.0)
+
+
+def spill_dir():
+    return str(getattr(settings, 'AUDIT_SPILL_DIR', os.path.join(settings.BASE_DIR, 'run', 'audit')))
+
+
+def _insert(events):
+    run_write(AuditEvent.objects.bulk_create, [AuditEvent(**e) for e in events], batch_size=500)
+
+
+def _spill(events):
+    """Append events to this process's JSONL segment so a database outage loses nothing."""
+    os.makedirs(spill_dir(), exist_ok=True)
+    path = os.path.join(spill_dir(), f'audit-{os.getpid()}.jsonl')
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(''.join(json.dumps({**e, 'created_at': e['created_at'].isoformat()}) + '\n' for e in events))
+
+
+def _replay_spills():
+    """Load JSONL segments left by failed flushes (from any process), then delete them."""
+    try:
+        names = [n for n in os.listdir(spill_dir()) if n.endswith('.jsonl')]
+    except FileNotFoundError:
+        return
+    for name in names:
+        path = os.path.join(spill_dir(), name)
+        claimed = path + '.replaying'
+        try:
+            os.rename(path, claimed)  # another process may be replaying it already
+        except FileNotFoundError:
+            continue
+        with open(claimed, encoding='utf-8') as f:
+            events = [json.loads(line) for line in f if line.strip()]
+        for e in events:
+            e['created_at'] = parse_datetime(e['created_at'])
+        try:
+            _insert(events)
+        except Exception:
+            os.rename(claimed, path)
+            raise
+        os.remove(claimed)
+        logger.info("Replayed %d spilled audit events from %s", len(events), name)
+
+
+class AuditBuffer:
+    """Events waiting to be written, and the thread that writes them."""
+
+    def __init__(self):
+        self._events = []
+        self._cond = threading.Condition()
+        self._pid = None
+
+    def append(self, event):
+        if self._pid != os.getpid():
+            self._start()
+        with self._cond:
+            self._events.append(event)
+            if len(self._events) >= batch_size():
+                self._cond.notify()
+
+    def _start(self):
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            # A forked child must not write its parent's pending events a second time
+            self._events = []
+            threading.Thread(target=self._run, name='audit-writer', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self._events) >= batch_size(), timeout=flush_interval())
+            self.flush()
+
+    def flush(self):
+        """Write everything buffered so far; return the number of events written."""
+        with self._cond:
+            events, self._events = self._events, []
+        if not events:
+            return 0
+        close_old_connections()
+        try:
+            _insert(events)
+        except Exception:
+            logger.exception("Audit flush of %d events failed, spilling to %s", len(events), spill_dir())
+            _spill(events)
+            return 0
+        try:
+            _replay_spills()
+        except Exception:
+            logger.exception("Replaying spilled audit events failed")
+        return len(events)
+
+
+_buffer = AuditBuffer()
+atexit.register(_buffer.flush)
+
+
+def record(kind, user=None, exp_key='', booking=None, **data):
+    """Buffer one audit event; user and booking may be model instances or ids.
+
+    Extra keyword arguments are stored in the event's JSON ``data``.
+    """
+    _buffer.append({
+        'created_at': timezone.now(),
+        'kind': kind,
+        'user_id': getattr(user, 'pk', user),
+        'exp_key': exp_key or '',
+        'booking_id': getattr(booking, 'pk', booking),
+        'data': data,
+    })
+
+
+def record_waitlist_bookings(entries):
+    """Record the bookings release_interval handed to waitlisted users."""
+    for entry in entries:
+        booking = entry.booking
+        record('booking_created', user=entry.user_id, exp_key=booking.experiment.exp_key, booking=booking,
+               start=booking.start_time.isoformat(), end=booking.end_time.isoformat(), via='waitlist')
+
+
+def flush():
+    """Write buffered events now instead of waiting for the writer thread."""
+    return _buffer.flush()
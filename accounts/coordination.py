@@ -0,0 +1,475 @@
+"""Locks, leases and invalidation messages shared by every worker process.
+
+A *lease* is a named claim with an owner string and a TTL: ``acquire``
+succeeds if nobody holds the name, the lease expired, or the caller
+already owns it (which renews it). ``lock`` is a blocking mutex built for
+short critical sections. ``publish``/``subscribe`` carry small
+invalidation messages between processes; a process sees its own messages
+at once and other processes' within ``poll_interval``. ``take_tokens``
+updates shared token buckets atomically (``RATE_LIMIT_BACKEND =
+'coordination'``).
+
+Backends (``settings.COORDINATION``):
+
+* ``file`` (default): ``fcntl`` file locks plus a small SQLite file for
+  leases and messages under ``PATH``. Works for any number of workers on
+  one host.
+* ``redis``: any client exposing the redis-py calls used by
+  ``RedisCoordinator`` (``redis.Redis.from_url(URL)``); ``URL: 'local://'``
+  uses ``LocalRedis``, an in-process stand-in for development and tests.
+"""
+import fcntl
+import json
+import logging
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+# Messages older than this are pruned; subscribers that fall further behind miss them
+MESSAGE_RETENTION = 3600
+
+
+class LockTimeout(Exception):
+    """A lock could not be acquired within its timeout."""
+
+
+def new_owner():
+    """A unique owner string for a lease or lock."""
+    return uuid.uuid4().hex
+
+
+class Coordinator:
+    """Base class; backends implement acquire/release/holders/_publish/_fetch."""
+
+    poll_interval = 0.5
+
+    def __init__(self):
+        self._origin = new_owner()
+        self._callbacks = {}
+        self._poller = None
+        self._poller_pid = None
+        self._poller_lock = threading.Lock()
+
+    def acquire(self, name, owner, ttl):
+        """Claim lease name for owner for ttl seconds; return False if someone else holds it."""
+        raise NotImplementedError
+
+    def release(self, name, owner):
+        """Drop lease name if owner still holds it."""
+        raise NotImplementedError
+
+    def holders(self, names):
+        """Return {name: owner} for the live leases among names."""
+        raise NotImplementedError
+
+    def holder(self, name):
+        """Owner of lease name, or None."""
+        return self.holders([name]).get(name)
+
+    def take_tokens(self, specs):
+        """Take one token from each (key, rate, burst) bucket if all have one.
+
+        Return 0 if allowed, else seconds until every bucket has a token;
+        a rejected call changes nothing. Same contract as
+        ``ratelimit.LocalBuckets.take``, but shared by every process.
+        """
+        raise NotImplementedError
+
+    @contextmanager
+    def lock(self, name, timeout=10, ttl=60):
+        """Hold a mutex on name for the duration of the block.
+
+        The lease TTL only matters if this process dies inside the block.
+        """
+        owner = new_owner()
+        deadline = time.monotonic() + timeout
+        delay = 0.005
+        while not self.acquire(f"lock:{name}", owner, ttl):
+            if time.monotonic() >= deadline:
+                raise LockTimeout(name)
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        try:
+            yield
+        finally:
+            self.release(f"lock:{name}", owner)
+
+    def publish(self, channel, message):
+        """Send message (a JSON-serialisable value) to every subscriber of channel."""
+        for callback in self._callbacks.get(channel, ()):
+            self._deliver(callback, message)
+        self._publish(channel, json.dumps([self._origin, message]))
+
+    def subscribe(self, channel, callback):
+        """Call callback(message) for every message published on channel from now on."""
+        self._callbacks.setdefault(channel, []).append(callback)
+        self._ensure_poller()
+
+    def _deliver(self, callback, message):
+        try:
+            callback(message)
+        except Exception:
+            logger.exception("Coordination subscriber failed")
+
+    def _ensure_poller(self):
+        # Threads don't survive fork, so each worker process starts its own
+        if self._poller_pid == os.getpid():
+            return
+        with self._poller_lock:
+            if self._poller_pid == os.getpid():
+                return
+            self._poller = threading.Thread(target=self._listen, name='coordination', daemon=True)
+            self._poller.start()
+            self._poller_pid = os.getpid()
+
+    def _listen(self):
+        for channel, payload in self._fetch():
+            origin, message = json.loads(payload)
+            if origin == self._origin:
+                continue
+            for callback in self._callbacks.get(channel, ()):
+                self._deliver(callback, message)
+
+    def _publish(self, channel, payload):
+        raise NotImplementedError
+
+    def _fetch(self):
+        """Yield (channel, payload) for messages published after the listener started, forever."""
+        raise NotImplementedError
+
+
+class FileCoordinator(Coordinator):
+    """Single-host backend: fcntl locks and an SQLite file for leases and messages."""
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = str(path)
+        os.makedirs(self.path, exist_ok=True)
+        self._local = threading.local()
+        self._db().executescript(
+            """
+            CREATE TABLE IF NOT EXISTS lease (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS message (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, payload TEXT NOT NULL, created REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS bucket (
+                name TEXT PRIMARY KEY, tokens REAL NOT NULL, last REAL NOT NULL, full_at REAL NOT NULL
+            );
+            """
+        )
+
+    def _db(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(os.path.join(self.path, 'coordination.sqlite3'), timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @contextmanager
+    def lock(self, name, timeout=10, ttl=60):
+        # The kernel drops flock locks of a dead process, so ttl isn't needed here
+        fd = os.open(os.path.join(self.path, f"{name.replace('/', '_')}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            deadline = time.monotonic() + timeout
+            delay = 0.005
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        raise LockTimeout(name)
+                    time.sleep(delay)
+                    delay = min(delay * 2, 0.1)
+            yield
+        finally:
+            os.close(fd)  # closing the descriptor releases the lock
+
+    def acquire(self, name, owner, ttl):
+        now = time.time()
+        db = self._db()
+        cur = db.execute(
+            "INSERT INTO lease (name, owner, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+            "WHERE lease.expires <= ? OR lease.owner = excluded.owner",
+            (name, owner, now + ttl, now),
+        )
+        if random.random() < 0.01:
+            db.execute("DELETE FROM lease WHERE expires <= ?", (now,))
+        return cur.rowcount == 1
+
+    def release(self, name, owner):
+        self._db().execute("DELETE FROM lease WHERE name = ? AND owner = ?", (name, owner))
+
+    def holders(self, names):
+        names = list(names)
+        if not names:
+            return {}
+        rows = self._db().execute(
+            f"SELECT name, owner FROM lease WHERE expires > ? AND name IN ({','.join('?' * len(names))})",
+            (time.time(), *names),
+        )
+        return dict(rows)
+
+    def take_tokens(self, specs):
+        now = time.time()
+        db = self._db()
+        names = [key for key, _, _ in specs]
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            rows = dict((name, (tokens, last)) for name, tokens, last in db.execute(
+                f"SELECT name, tokens, last FROM bucket WHERE name IN ({','.join('?' * len(names))})", names
+            ))
+            levels = []
+            wait = 0.0
+            for key, rate, burst in specs:
+                tokens, last = rows.get(key, (burst, now))
+                tokens = min(burst, tokens + max(now - last, 0) * rate)
+                levels.append((key, tokens - 1, now, now + (burst - tokens + 1) / rate))
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+            if not wait:
+                db.executemany(
+                    "INSERT INTO bucket (name, tokens, last, full_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, last = excluded.last, "
+                    "full_at = excluded.full_at", levels,
+                )
+                if random.random() < 0.001:
+                    db.execute("DELETE FROM bucket WHERE full_at <= ?", (now,))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return wait
+
+    def _publish(self, channel, payload):
+        now = time.time()
+        db = self._db()
+        db.execute("INSERT INTO message (channel, payload, created) VALUES (?, ?, ?)", (channel, payload, now))
+        if random.random() < 0.01:
+            db.execute("DELETE FROM message WHERE created < ?", (now - MESSAGE_RETENTION,))
+
+    def _fetch(self):
+        db = self._db()
+        last = db.execute("SELECT COALESCE(MAX(id), 0) FROM message").fetchone()[0]
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                rows = db.execute(
+                    "SELECT id, channel, payload FROM message WHERE id > ? ORDER BY id", (last,)
+                ).fetchall()
+            except sqlite3.Error:
+                logger.exception("Coordination poll failed")
+                continue
+            for message_id, channel, payload in rows:
+                last = message_id
+                yield channel, payload
+
+
+class RedisCoordinator(Coordinator):
+    """Backend for a shared Redis-compatible server (client created with decode_responses=True)."""
+
+    # Delete key only if it still holds this owner's value
+    RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+    # Set key if it is free or already ours, refreshing the expiry
+    ACQUIRE_SCRIPT = (
+        "local v = redis.call('get', KEYS[1]) "
+        "if v == false or v == ARGV[1] then redis.call('set', KEYS[1], ARGV[1], 'PX', ARGV[2]) return 1 end "
+        "return 0"
+    )
+    # Token buckets as hashes {t: tokens, l: last update}; ARGV = now, then rate, burst per key.
+    # Returns the wait as a string (Lua numbers come back truncated to integers).
+    TAKE_SCRIPT = (
+        "local now = tonumber(ARGV[1]) local wait = 0 local levels = {} "
+        "for i, key in ipairs(KEYS) do "
+        "local rate, burst = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1]) "
+        "local v = redis.call('hmget', key, 't', 'l') "
+        "local tokens = math.min(burst, (tonumber(v[1]) or burst) + math.max(now - (tonumber(v[2]) or now), 0) * rate) "
+        "levels[i] = tokens "
+        "if tokens < 1 then wait = math.max(wait, (1 - tokens) / rate) end end "
+        "if wait > 0 then return tostring(wait) end "
+        "for i, key in ipairs(KEYS) do "
+        "local rate, burst = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1]) "
+        "redis.call('hset', key, 't', levels[i] - 1, 'l', now) "
+        "redis.call('pexpire', key, math.ceil((burst - levels[i] + 1) / rate * 1000)) end "
+        "return '0'"
+    )
+
+    def __init__(self, client, prefix='lab:'):
+        super().__init__()
+        self.client = client
+        self.prefix = prefix
+
+    def acquire(self, name, owner, ttl):
+        return self.client.eval(self.ACQUIRE_SCRIPT, 1, self.prefix + name, owner, int(ttl * 1000)) == 1
+
+    def release(self, name, owner):
+        self.client.eval(self.RELEASE_SCRIPT, 1, self.prefix + name, owner)
+
+    def holders(self, names):
+        names = list(names)
+        if not names:
+            return {}
+        values = self.client.mget([self.prefix + n for n in names])
+        return {n: v for n, v in zip(names, values) if v is not None}
+
+    def take_tokens(self, specs):
+        args = [time.time()]
+        for _, rate, burst in specs:
+            args += [rate, burst]
+        keys = [f"{self.prefix}bucket:{key}" for key, _, _ in specs]
+        return float(self.client.eval(self.TAKE_SCRIPT, len(keys), *keys, *args))
+
+    def _publish(self, channel, payload):
+        self.client.publish(self.prefix + channel, payload)
+
+    def _fetch(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        subscribed = set()
+        while True:
+            wanted = set(self._callbacks) - subscribed
+            if wanted:
+                pubsub.subscribe(*(self.prefix + c for c in wanted))
+                subscribed |= wanted
+            try:
+                message = pubsub.get_message(timeout=self.poll_interval)
+            except Exception:
+                logger.exception("Coordination poll failed")
+                time.sleep(self.poll_interval)
+                continue
+            if message and message.get('type') == 'message':
+                yield message['channel'][len(self.prefix):], message['data']
+
+
+class LocalRedis:
+    """In-process stand-in for the redis-py calls RedisCoordinator makes.
+
+    Only understands RedisCoordinator's scripts; meant for development
+    and for exercising the Redis code path without a server.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        item = self._data.get(key)
+        if item is not None and item[1] is not None and item[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        return item and item[0]
+
+    def eval(self, script, numkeys, *keys_and_args):
+        if script == RedisCoordinator.TAKE_SCRIPT:
+            return self._take(keys_and_args[:numkeys], keys_and_args[numkeys:])
+        key, owner, *args = keys_and_args
+        with self._lock:
+            current = self._live(key)
+            if script == RedisCoordinator.ACQUIRE_SCRIPT:
+                if current is None or current == owner:
+                    self._data[key] = (owner, time.monotonic() + int(args[0]) / 1000)
+                    return 1
+                return 0
+            if script == RedisCoordinator.RELEASE_SCRIPT:
+                if current == owner:
+                    del self._data[key]
+                    return 1
+                return 0
+        raise NotImplementedError('LocalRedis only runs RedisCoordinator scripts')
+
+    def _take(self, keys, args):
+        now = float(args[0])
+        with self._lock:
+            levels = []
+            wait = 0.0
+            for i, key in enumerate(keys):
+                rate, burst = float(args[1 + 2 * i]), float(args[2 + 2 * i])
+                tokens, last = self._live(key) or (burst, now)
+                tokens = min(burst, tokens + max(now - last, 0) * rate)
+                levels.append((key, tokens, rate, burst))
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+            if wait:
+                return str(wait)
+            for key, tokens, rate, burst in levels:
+                self._data[key] = ((tokens - 1, now), time.monotonic() + (burst - tokens + 1) / rate)
+            return '0'
+
+    def mget(self, keys):
+        with self._lock:
+            return [self._live(k) for k in keys]
+
+    def publish(self, channel, payload):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for pubsub in subscribers:
+            pubsub._receive(channel, payload)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        pubsub = _LocalPubSub()
+        with self._lock:
+            self._subscribers.append(pubsub)
+        return pubsub
+
+
+class _LocalPubSub:
+    def __init__(self):
+        self._channels = set()
+        self._queue = queue.SimpleQueue()
+
+    def subscribe(self, *channels):
+        self._channels.update(channels)
+
+    def _receive(self, channel, payload):
+        if channel in self._channels:
+            self._queue.put({'type': 'message', 'channel': channel, 'data': payload})
+
+    def get_message(self, timeout=0.0):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+def build_coordinator(config):
+    """Create the backend described by a COORDINATION settings dict."""
+    backend = config.get('BACKEND', 'file')
+    if backend == 'file':
+        return FileCoordinator(config.get('PATH') or os.path.join(settings.BASE_DIR, 'run', 'coordination'))
+    if backend == 'redis':
+        url = config.get('URL', 'redis://localhost:6379/0')
+        if url == 'local://':
+            return RedisCoordinator(LocalRedis())
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured("COORDINATION backend 'redis' needs the redis package (pip install redis)")
+        return RedisCoordinator(redis.Redis.from_url(url, decode_responses=True))
+    raise ImproperlyConfigured(f"Unknown COORDINATION backend {backend!r}")
+
+
+_coordinator = None
+_coordinator_lock = threading.Lock()
+
+
+def get_coordinator():
+    """The process-wide coordinator configured in settings.COORDINATION."""
+    global _coordinator
+    if _coordinator is None:
+        with _coordinator_lock:
+            if _coordinator is None:
+                _coordinator = build_coordinator(getattr(settings, 'COORDINATION', {}))
+    return _coordinator
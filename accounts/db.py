@@ -0,0 +1,60 @@
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class WriteQueue:
+    """Run database writes one at a time on a dedicated thread.
+
+    SQLite allows a single writer; queueing writes in-process means request
+    threads never spin on the write lock, and readers (WAL) never block.
+    """
+
+    def __init__(self):
+        self._jobs = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name='sqlite-writer', daemon=True)
+                self._thread.start()
+
+    def _worker(self):
+        while True:
+            fn, args, kwargs, future = self._jobs.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            close_old_connections()
+            try:
+                with transaction.atomic():
+                    result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn for the writer thread and return a Future for its result."""
+        self._ensure_started()
+        future = Future()
+        self._jobs.put((fn, args, kwargs, future))
+        return future
+
+
+_write_queue = WriteQueue()
+
+
+def run_write(fn, *args, **kwargs):
+    """Run fn(*args, **kwargs) in a transaction, via the writer thread if enabled."""
+    if getattr(settings, 'SQLITE_WRITE_QUEUE', False):
+        return _write_queue.submit(fn, *args, **kwargs).result()
+    with transaction.atomic():
+        return fn(*args, **kwargs)
@@ -0,0 +1,129 @@
+"""Short-lived slot holds between picking a slot and posting the booking.
+
+A hold claims every 5-minute bucket its interval covers as a coordinator
+lease (atomic "claim if free"), each carrying the hold TTL. Expired holds
+simply lapse, so nothing ever scans for them, and every worker process
+sees the same holds (see ``accounts.coordination``).
+"""
+import json
+from datetime import datetime, timedelta
+
+from django.conf import settings
+
+from .coordination import get_coordinator, new_owner
+from .slots import SLOT_STEP
+
+BUCKET_SECONDS = 300
+HOLDERS_CHUNK = 900
+
+
+def hold_seconds():
+    """Lifetime of a hold in seconds."""
+    return getattr(settings, 'SLOT_HOLD_SECONDS', 180)
+
+
+def _bucket_keys(exp_key, start, end):
+    """Lease names of the 5-minute buckets [start, end) touches."""
+    first = int(start.timestamp()) // BUCKET_SECONDS
+    last = -(-int(end.timestamp()) // BUCKET_SECONDS)  # ceil
+    return [f"hold:{exp_key}:{b}" for b in range(first, last)]
+
+
+def _user_key(user_id):
+    return f"hold-user:{user_id}"
+
+
+def _current(user_id):
+    """(owner, token, exp_key, start, end) of user_id's live hold, or None."""
+    owner = get_coordinator().holder(_user_key(user_id))
+    if owner is None:
+        return None
+    token, exp_key, start, end = json.loads(owner)
+    return owner, token, exp_key, datetime.fromisoformat(start), datetime.fromisoformat(end)
+
+
+def place_hold(user_id, exp_key, start, end):
+    """Hold [start, end) for user_id; return the hold token, or None if someone else holds part of it.
+
+    A user has at most one hold: placing a new one releases the previous one.
+    """
+    release_hold(user_id)
+    coordinator = get_coordinator()
+    token = new_owner()
+    owner = f"{token}:{user_id}"
+    ttl = hold_seconds()
+    claimed = []
+    for key in _bucket_keys(exp_key, start, end):
+        if not coordinator.acquire(key, owner, ttl):
+            for k in claimed:
+                coordinator.release(k, owner)
+            return None
+        claimed.append(key)
+    coordinator.acquire(_user_key(user_id), json.dumps([token, exp_key, start.isoformat(), end.isoformat()]), ttl)
+    return token
+
+
+def release_hold(user_id):
+    """Drop user_id's current hold, if it is still live."""
+    current = _current(user_id)
+    if not current:
+        return
+    owner, token, exp_key, start, end = current
+    coordinator = get_coordinator()
+    for key in _bucket_keys(exp_key, start, end):
+        coordinator.release(key, f"{token}:{user_id}")
+    coordinator.release(_user_key(user_id), owner)
+
+
+def owns_hold(user_id, exp_key, start, end):
+    """True if user_id holds exactly [start, end) on exp_key and the hold hasn't expired."""
+    current = _current(user_id)
+    if not current or current[2:] != (exp_key, start, end):
+        return False
+    keys = _bucket_keys(exp_key, start, end)
+    held = get_coordinator().holders(keys)
+    return len(held) == len(keys) and all(v == f"{current[1]}:{user_id}" for v in held.values())
+
+
+def holders(exp_key, start, end):
+    """Return {bucket_key: user_id} for live holds inside [start, end) in one coordinator call."""
+    return {
+        k: int(v.rsplit(':', 1)[1])
+        for k, v in get_coordinator().holders(_bucket_keys(exp_key, start, end)).items()
+    }
+
+
+def held_intervals(exp_key, start, end):
+    """Return sorted (bucket_start, bucket_end) intervals inside [start, end) that anyone holds."""
+    tz = start.tzinfo
+    keys = _bucket_keys(exp_key, start, end)
+    held = {}
+    # Chunked so week-long windows stay under SQLite's bound-parameter limit
+    for i in range(0, len(keys), HOLDERS_CHUNK):
+        held.update(get_coordinator().holders(keys[i:i + HOLDERS_CHUNK]))
+    spans = []
+    for key in held:
+        bucket = int(key.rsplit(':', 1)[1])
+        spans.append((datetime.fromtimestamp(bucket * BUCKET_SECONDS, tz),
+                      datetime.fromtimestamp((bucket + 1) * BUCKET_SECONDS, tz)))
+    return sorted(spans)
+
+
+def held_by_others(exp_key, start, end, user_id):
+    """True if any part of [start, end) is held by a different user."""
+    return any(uid != user_id for uid in holders(exp_key, start, end).values())
+
+
+def mark_held_slots(slots, exp_key, current, duration, user_id):
+    """Relabel available slots from build_slots(current, ...) that another user holds as 'held'."""
+    length = timedelta(minutes=duration)
+    held = holders(exp_key, current, current + SLOT_STEP * len(slots) + length)
+    if not held:
+        return slots
+    for i, slot in enumerate(slots):
+        if slot['status'] != 'available':
+            continue
+        start = current + SLOT_STEP * i
+        if any(held.get(k, user_id) != user_id for k in _bucket_keys(exp_key, start, start + length)):
+            slot['status'] = 'held'
+    return slots
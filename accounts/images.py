@@ -0,0 +1,120 @@
+"""Profile picture normalisation and cached thumbnail variants.
+
+Uploads are re-encoded once (EXIF orientation applied then stripped,
+longest side capped) and stored under a content-hash name. Thumbnails are
+derived from that hash, so their URLs never change for a given picture and
+can be cached by the browser for a year as immutable. Variants are written
+to ``MEDIA_ROOT/avatars`` on first use; warm-up after an upload runs on a
+small thread pool so the request that saved the picture doesn't wait.
+"""
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+AVATAR_SIZES = (32, 64, 128, 256)
+DIGEST_RE = re.compile(r'[0-9a-f]{16}')
+AVATAR_FORMATS = {'webp': ('WEBP', 'image/webp'), 'jpg': ('JPEG', 'image/jpeg')}
+# What rendering a variant of a corrupt or oversized picture can raise
+RENDER_ERRORS = (OSError, ValueError, Image.DecompressionBombError)
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='avatars')
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def max_dimension():
+    """Longest side, in pixels, an uploaded profile picture is scaled down to."""
+    return getattr(settings, 'PROFILE_PIC_MAX_DIMENSION', 1024)
+
+
+def _to_rgb(image):
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def normalize_upload(uploaded):
+    """Return a ContentFile of the upload as an orientation-fixed, EXIF-free, size-capped JPEG.
+
+    The file name is the first 16 hex digits of its SHA-256, so identical
+    pictures share one file and variant cache.
+    """
+    uploaded.seek(0)
+    with Image.open(uploaded) as image:
+        image = ImageOps.exif_transpose(image)
+        image = _to_rgb(image)
+        image.thumbnail((max_dimension(), max_dimension()), Image.LANCZOS)
+        out = io.BytesIO()
+        # Re-encoding without exif= drops all metadata (GPS, camera, ...)
+        image.save(out, 'JPEG', quality=88, optimize=True, progressive=True)
+    data = out.getvalue()
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    return ContentFile(data, name=f'{digest}.jpg')
+
+
+def source_path(digest):
+    """Filesystem path of the normalised picture with this content hash."""
+    return os.path.join(settings.MEDIA_ROOT, 'profile_pics', f'{digest}.jpg')
+
+
+def source_hash(field_file):
+    """Content hash of a normalised profile picture (its file name stem), or None for legacy uploads."""
+    stem = os.path.splitext(os.path.basename(field_file.name))[0]
+    return stem if DIGEST_RE.fullmatch(stem) else None
+
+
+def variant_path(digest, size, ext):
+    """Where the size x size ext variant of picture digest is cached."""
+    return os.path.join(settings.MEDIA_ROOT, 'avatars', digest, f'{size}.{ext}')
+
+
+def _render_variant(src, target_path, size, ext):
+    if os.path.exists(target_path):
+        return target_path
+    fmt = AVATAR_FORMATS[ext][0]
+    with Image.open(src) as image:
+        thumb = ImageOps.fit(_to_rgb(image), (size, size), Image.LANCZOS)
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    # Write to a temp name first so concurrent readers never see a partial file
+    tmp_path = f'{target_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    thumb.save(tmp_path, fmt, quality=82)
+    os.replace(tmp_path, target_path)
+    return target_path
+
+
+def ensure_variant(src, digest, size, ext):
+    """Return a Future for the variant file path, generating it at most once at a time."""
+    target_path = variant_path(digest, size, ext)
+    with _inflight_lock:
+        future = _inflight.get(target_path)
+        if future is None:
+            future = _executor.submit(_render_variant, src, target_path, size, ext)
+            _inflight[target_path] = future
+            future.add_done_callback(lambda f: _inflight.pop(target_path, None))
+    return future
+
+
+def warm_variants(field_file):
+    """Queue every avatar variant of a saved profile picture in the background."""
+    if not field_file:
+        return
+    digest = source_hash(field_file)
+    if digest is None:
+        return
+    for size in AVATAR_SIZES:
+        for ext in AVATAR_FORMATS:
+            if not os.path.exists(variant_path(digest, size, ext)):
+                ensure_variant(field_file.path, digest, size, ext)
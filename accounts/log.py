@@ -0,0 +1,174 @@
+"""Non-blocking structured logging for the request path.
+
+Request threads only append the LogRecord to an in-memory queue
+(``QueueingHandler``); a background thread drains the queue in batches,
+renders each record as one JSON line and writes the whole batch with a
+single write/flush. Like ``logging.handlers.QueueHandler``, the handler
+merges message arguments and renders tracebacks before enqueueing, so the
+writer thread never touches request objects (which could change meanwhile,
+or run queries from the wrong thread) and queued records don't keep
+tracebacks' frames alive. Records filtered out by level or sampling still
+cost nothing.
+"""
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+
+class JsonFormatter(logging.Formatter):
+    """Render a record as a single JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'thread': record.threadName,
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        for key in ('status_code', 'user', 'exp', 'duration_ms'):
+            if hasattr(record, key):
+                entry[key] = getattr(record, key)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of sub-WARNING records from noisy loggers.
+
+    ``rates`` maps logger name prefixes to the fraction kept, e.g.
+    ``{'django.server': 0.1}``. Warnings and errors always pass.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = sorted((rates or {}).items(), key=lambda item: -len(item[0]))
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + '.'):
+                return random.random() < rate
+        return True
+
+
+class BatchingListener:
+    """Background thread that writes queued records in batches."""
+
+    def __init__(self, q, stream, formatter, batch_size=256, flush_interval=0.5):
+        self.queue = q
+        self.stream = stream
+        self.formatter = formatter
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._stop = object()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Flush everything queued so far and stop the writer thread."""
+        if self._thread and self._thread.is_alive():
+            self.queue.put(self._stop)
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = self._stop in batch
+            lines = []
+            for record in batch:
+                if record is self._stop:
+                    continue
+                try:
+                    lines.append(self.formatter.format(record))
+                except Exception:
+                    lines.append(json.dumps({'level': 'ERROR', 'logger': 'accounts.log', 'msg': 'unformattable record'}))
+            if lines:
+                try:
+                    self.stream.write('\n'.join(lines) + '\n')
+                    self.stream.flush()
+                except Exception:
+                    pass
+            if stopping:
+                return
+
+
+class QueueingHandler(logging.Handler):
+    """Enqueue self-contained copies of records for BatchingListener to format.
+
+    The listener is started lazily per process so it also works under
+    pre-fork servers, where threads don't survive the fork.
+    """
+
+    def __init__(self, stream='ext://sys.stderr', batch_size=256, flush_interval=0.5, sampling=None):
+        super().__init__()
+        self.queue = queue.SimpleQueue()
+        self._stream = stream
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        if sampling:
+            self.addFilter(SamplingFilter(sampling))
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            stream = sys.stderr if self._stream == 'ext://sys.stderr' else (
+                sys.stdout if self._stream == 'ext://sys.stdout' else open(self._stream, 'a', encoding='utf-8')
+            )
+            self.queue = queue.SimpleQueue()
+            self._listener = BatchingListener(
+                self.queue, stream, self.formatter or JsonFormatter(), self._batch_size, self._flush_interval
+            )
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record):
+        """Return a copy of record with its message merged and traceback rendered."""
+        record = copy.copy(record)  # other handlers may still format the original
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = (self.formatter or JsonFormatter()).formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def emit(self, record):
+        try:
+            self._ensure_listener()
+            self.queue.put(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        # Drains the queue; called by logging.shutdown() at interpreter exit
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._pid = None
+        super().close()
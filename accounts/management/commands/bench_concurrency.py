@@ -0,0 +1,93 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from accounts.management.commands.bench_http import _wait_ready, load
+
+
+class _SlowTestbedServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def _slow_handler(delay):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self):
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        do_GET = do_HEAD = _reply
+
+        def log_message(self, *args):
+            pass
+    return Handler
+
+
+class Command(BaseCommand):
+    help = 'Compare the threaded WSGI and the ASGI worker pool on the testbed status endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=32, help='In-flight requests, the same for both servers')
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes, the same for both servers')
+        parser.add_argument('--threads', type=int, default=4, help='Threads per WSGI worker')
+        parser.add_argument('--delay', type=float, default=0.1, help='Stand-in testbed latency (s)')
+
+    def handle(self, *args, **options):
+        # Both servers probe every testbed on a slow local stand-in instead of the lab network
+        server = _SlowTestbedServer(('127.0.0.1', 0), _slow_handler(options['delay']))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        # Probe on every request: cached results would measure the cache, not the servers
+        env = dict(
+            os.environ,
+            TESTBED_URL_OVERRIDE=f'http://127.0.0.1:{server.server_address[1]}',
+            SERVICE_PROBE_CACHE_SECONDS='0',
+        )
+        # The status endpoint needs a login; both servers share the database and its sessions
+        user, _ = get_user_model().objects.get_or_create(username='bench-status', defaults={'email': 'bench-status@localhost'})
+        client = Client()
+        client.force_login(user)
+        headers = {'Cookie': f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'}
+
+        launcher = os.path.join(settings.BASE_DIR, 'manage-p5g.py')
+        common = ['--bind', '127.0.0.1', '--workers', str(options['workers'])]
+        modes = [
+            (f"WSGI ({options['threads']} threads/worker)", ['--threads', str(options['threads'])], 8111),
+            ('ASGI', ['--asgi'], 8112),
+        ]
+        results = []
+        try:
+            for label, extra, port in modes:
+                base = f'http://127.0.0.1:{port}'
+                proc = subprocess.Popen(
+                    [sys.executable, launcher, *common, '--port', str(port), *extra],
+                    cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                    start_new_session=True,
+                )
+                try:
+                    _wait_ready(base)
+                    rps, errors = load(base + '/accounts/api/status/', options['concurrency'], options['seconds'], headers)
+                finally:
+                    os.killpg(proc.pid, signal.SIGTERM)
+                    proc.wait()
+                results.append(rps)
+                self.stdout.write(f"{label:>24}: {rps:8.1f} req/s, {errors} errors")
+        finally:
+            server.shutdown()
+            client.logout()
+
+        self.stdout.write(
+            f"{options['workers']} worker(s) each, {options['concurrency']} requests in flight; "
+            f"ASGI/WSGI: {results[1] / results[0]:.1f}x"
+        )
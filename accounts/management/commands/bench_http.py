@@ -0,0 +1,82 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _wait_ready(base, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(base + '/accounts/api/ready/', timeout=1) as resp:
+                if resp.status == 200:
+                    return
+        except Exception:
+            time.sleep(0.2)
+    raise CommandError(f'Server at {base} did not become ready')
+
+
+def load(url, concurrency, seconds, headers=None):
+    """Hammer url from concurrency threads for seconds; return (requests/s, errors)."""
+    deadline = time.monotonic() + seconds
+    done = [0] * concurrency
+    errors = [0] * concurrency
+
+    def worker(i):
+        while time.monotonic() < deadline:
+            try:
+                with urllib.request.urlopen(urllib.request.Request(url, headers=headers or {}), timeout=10) as resp:
+                    resp.read()
+                done[i] += 1
+            except Exception:
+                errors[i] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(done) / seconds, sum(errors)
+
+
+class Command(BaseCommand):
+    help = 'HTTP throughput of a running portal, or of runserver vs the manage-p5g.py worker pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Benchmark this URL instead of launching servers')
+        parser.add_argument('--path', default='/', help='Path to request when launching servers')
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--seconds', type=float, default=10)
+
+    def handle(self, *args, **options):
+        if options['url']:
+            rps, errors = load(options['url'], options['concurrency'], options['seconds'])
+            self.stdout.write(f"{rps:.1f} req/s, {errors} errors")
+            return
+
+        launcher = os.path.join(settings.BASE_DIR, 'manage-p5g.py')
+        modes = [
+            ('runserver', ['--dev'], 8101),
+            ('workers (WSGI)', [], 8102),
+            ('workers (ASGI)', ['--asgi'], 8103),
+        ]
+        for label, extra, port in modes:
+            base = f'http://127.0.0.1:{port}'
+            proc = subprocess.Popen(
+                [sys.executable, launcher, '--bind', '127.0.0.1', '--port', str(port), *extra],
+                cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                start_new_session=True,  # runserver's autoreloader forks; kill the whole group
+            )
+            try:
+                _wait_ready(base)
+                rps, errors = load(base + options['path'], options['concurrency'], options['seconds'])
+            finally:
+                os.killpg(proc.pid, signal.SIGTERM)
+                proc.wait()
+            self.stdout.write(f"{label:>16}: {rps:8.1f} req/s, {errors} errors")
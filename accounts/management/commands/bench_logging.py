@@ -0,0 +1,51 @@
+import logging
+import tempfile
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from accounts.log import JsonFormatter, QueueingHandler
+
+
+def _per_call(fn, n):
+    started = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    return (time.perf_counter() - started) / n * 1e6
+
+
+class Command(BaseCommand):
+    help = 'Caller-side cost of a log call: synchronous file handler vs the queued JSON handler'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=50000)
+
+    def handle(self, *args, **options):
+        n = options['calls']
+        start = datetime(2026, 1, 1, 10, 30)
+
+        with tempfile.NamedTemporaryFile('w', suffix='.log') as sync_file, \
+                tempfile.NamedTemporaryFile('w', suffix='.log') as queued_file:
+            sync_handler = logging.StreamHandler(open(sync_file.name, 'a'))
+            sync_handler.setFormatter(JsonFormatter())
+            queued_handler = QueueingHandler(stream=queued_file.name)
+            queued_handler.setFormatter(JsonFormatter())
+
+            results = []
+            for label, handler in (('sync file', sync_handler), ('queued', queued_handler)):
+                log = logging.getLogger(f'bench.{label}')
+                log.propagate = False
+                log.handlers = [handler]
+                log.setLevel(logging.INFO)
+
+                fstring = _per_call(lambda i: log.info(f"Booking: start={start}, id={i}, duration={60}min"), n)
+                lazy = _per_call(lambda i: log.info("Booking: start=%s, id=%d, duration=%dmin", start, i, 60), n)
+                filtered_f = _per_call(lambda i: log.debug(f"Parsed start_time: {start}, tzinfo: {start.tzinfo}"), n)
+                filtered_lazy = _per_call(lambda i: log.debug("Parsed start_time: %s, tzinfo: %s", start, start.tzinfo), n)
+                results.append((label, fstring, lazy, filtered_f, filtered_lazy))
+                handler.close()
+
+        self.stdout.write(f"{'handler':<10} {'f-string':>10} {'%-style':>10} {'filtered f':>11} {'filtered %':>11}  (us/call)")
+        for label, *costs in results:
+            self.stdout.write(f"{label:<10} " + ' '.join(f"{c:>10.2f}" for c in costs))
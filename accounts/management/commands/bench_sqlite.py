@@ -0,0 +1,101 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+SCHEMA = """
+CREATE TABLE booking (id INTEGER PRIMARY KEY, exp INTEGER, start REAL, "end" REAL, status TEXT);
+CREATE INDEX booking_exp_start ON booking (exp, start);
+"""
+
+
+class Command(BaseCommand):
+    help = 'Mixed read/write SQLite throughput: stock settings vs the production profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=3.0)
+        parser.add_argument('--write-ratio', type=float, default=0.2)
+
+    def handle(self, *args, **options):
+        for profile in ('stock', 'production'):
+            ops, errors = self._run(profile, options['threads'], options['seconds'], options['write_ratio'])
+            self.stdout.write(
+                f"{profile:>10}: {ops / options['seconds']:8.0f} ops/s, {errors} 'database is locked' errors"
+            )
+
+    def _connect(self, path, profile):
+        if profile == 'stock':
+            # Django's defaults: rollback journal, 5s timeout, deferred transactions
+            return sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        for key, value in settings.SQLITE_PRAGMAS.items():
+            conn.execute(f'PRAGMA {key}={value}')
+        return conn
+
+    def _run(self, profile, threads, seconds, write_ratio):
+        fd, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        setup = self._connect(path, profile)
+        setup.executescript(SCHEMA)
+        setup.executemany(
+            'INSERT INTO booking (exp, start, "end", status) VALUES (?, ?, ?, ?)',
+            [(i % 5, i * 1800.0, i * 1800.0 + 3600, 'active') for i in range(5000)],
+        )
+        setup.close()
+
+        counts = [0] * threads
+        errors = [0] * threads
+        deadline = time.monotonic() + seconds
+
+        def worker(idx):
+            rng = random.Random(idx)
+            # The production profile keeps one connection per thread (CONN_MAX_AGE);
+            # stock Django reconnects for every request.
+            conn = self._connect(path, profile) if profile == 'production' else None
+            while time.monotonic() < deadline:
+                c = conn or self._connect(path, profile)
+                t = rng.random() * 5000 * 1800
+                try:
+                    if rng.random() < write_ratio:
+                        c.execute('BEGIN IMMEDIATE' if profile == 'production' else 'BEGIN')
+                        c.execute(
+                            'SELECT 1 FROM booking WHERE exp = ? AND start < ? AND "end" > ? AND status = ?',
+                            (idx % 5, t + 3600, t, 'active'),
+                        ).fetchone()
+                        c.execute(
+                            'INSERT INTO booking (exp, start, "end", status) VALUES (?, ?, ?, ?)',
+                            (idx % 5, t, t + 3600, 'active'),
+                        )
+                        c.execute('COMMIT')
+                    else:
+                        c.execute(
+                            'SELECT start, "end" FROM booking WHERE exp = ? AND start BETWEEN ? AND ?',
+                            (idx % 5, t, t + 86400),
+                        ).fetchall()
+                    counts[idx] += 1
+                except sqlite3.OperationalError:
+                    errors[idx] += 1
+                    if c.in_transaction:
+                        c.execute('ROLLBACK')
+                finally:
+                    if conn is None:
+                        c.close()
+            if conn is not None:
+                conn.close()
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        return sum(counts), sum(errors)
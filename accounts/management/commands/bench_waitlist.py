@@ -0,0 +1,67 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from accounts.db import run_write
+from accounts.models import Experiment, SessionBooking, User, WaitlistEntry
+from accounts.waitlist import cancel_and_reassign
+
+
+class Command(BaseCommand):
+    help = 'Simulate cancel/waitlist churn on a throwaway test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue-sizes', type=int, nargs='+', default=[100, 1000, 10000])
+        parser.add_argument('--cancellations', type=int, default=300)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0)
+        old_config = runner.setup_databases()
+        try:
+            for size in options['queue_sizes']:
+                per_cancel = self._churn(size, options['cancellations'])
+                self.stdout.write(f"queue={size:>6}: {per_cancel * 1000:.2f} ms per cancel+match")
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+    def _churn(self, queue_size, cancellations):
+        rng = random.Random(queue_size)
+        WaitlistEntry.objects.all().delete()
+        SessionBooking.objects.all().delete()
+        users = [User.objects.get_or_create(username=f'bench{i}', defaults={'email': f'bench{i}@lab'})[0] for i in range(50)]
+        experiments = [
+            Experiment.objects.get_or_create(exp_key=f'bench{i}', defaults={'name': f'Bench {i}', 'url': 'http://127.0.0.1'})[0]
+            for i in range(5)
+        ]
+
+        # A fully booked week of 60-minute sessions per experiment
+        start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        SessionBooking.objects.bulk_create([
+            SessionBooking(user=rng.choice(users), experiment=exp, start_time=start + timedelta(hours=h),
+                           end_time=start + timedelta(hours=h + 1))
+            for exp in experiments for h in range(24 * 7)
+        ])
+
+        # Waiters for random windows, most of which don't fit any given cancellation
+        entries = []
+        for _ in range(queue_size):
+            w_start = start + timedelta(minutes=rng.randrange(0, 24 * 7 * 60, 15))
+            entries.append(WaitlistEntry(
+                user=rng.choice(users), experiment=rng.choice(experiments), window_start=w_start,
+                window_end=w_start + timedelta(minutes=rng.choice([60, 120, 240])), duration=rng.choice([30, 60, 90]),
+            ))
+        WaitlistEntry.objects.bulk_create(entries)
+
+        active = list(SessionBooking.objects.filter(status='active').select_related('experiment'))
+        victims = rng.sample(active, min(cancellations, len(active)))
+        started = time.perf_counter()
+        for booking in victims:
+            run_write(cancel_and_reassign, booking)
+        return (time.perf_counter() - started) / len(victims)
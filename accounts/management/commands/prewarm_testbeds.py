@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from accounts.prewarm import lead_time, run_prewarm
+
+
+class Command(BaseCommand):
+    help = 'Restart testbeds ahead of upcoming bookings (run from cron, or with --loop)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running instead of a single pass')
+        parser.add_argument('--interval', type=int, default=60, help='Seconds between passes with --loop')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Pre-warming testbeds {lead_time()} before bookings start")
+        while True:
+            counts = run_prewarm()
+            self.stdout.write(
+                "warmed {warmed}, failed {failed}, back-to-back {skipped}, deferred {deferred}".format(**counts)
+            )
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,37 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.orchestrator import plan_succeeded, run_plan
+from accounts.restart_plans import RESTART_PLANS, get_plan, stand_in_plan
+
+
+class Command(BaseCommand):
+    help = 'Run an experiment restart plan in the foreground and print per-step timings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('exp_key', choices=sorted(RESTART_PLANS))
+        parser.add_argument('--stand-in', action='store_true', help='Replace remote commands with local sleeps')
+        parser.add_argument('--scale', type=float, default=1.0, help='Stand-in duration multiplier')
+
+    def handle(self, *args, **options):
+        steps = get_plan(options['exp_key'])
+        if options['stand_in']:
+            steps = stand_in_plan(steps, options['scale'])
+
+        started = time.monotonic()
+        results = asyncio.run(run_plan(steps))
+        wall = time.monotonic() - started
+
+        for step in steps:
+            r = results[step.name]
+            self.stdout.write(
+                f"{step.name:<16} {r['status']:<8} start={r.get('started', '-')!s:<7} "
+                f"done={r.get('finished', '-')!s:<7} ready={r.get('ready_at', '-')}"
+            )
+        # What one-after-another execution (as in core_restart.sh) would have taken
+        serial = sum(r['ready_at'] - r['started'] for r in results.values() if 'ready_at' in r)
+        self.stdout.write(f"Plan wall time {wall:.2f}s vs {serial:.2f}s run serially")
+        if not plan_succeeded(results):
+            raise CommandError('Restart plan did not complete')
@@ -0,0 +1,18 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from accounts.services import restart_lease_seconds, run_restart_worker
+
+
+class Command(BaseCommand):
+    help = 'Run testbed restarts queued by the web workers (RESTART_RUNNER = "worker"); manage-p5g.py starts it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=float, default=None,
+                            help='Seconds running restarts get to finish on SIGTERM (default RESTART_LEASE_SECONDS)')
+
+    def handle(self, *args, **options):
+        grace = restart_lease_seconds() if options['grace'] is None else options['grace']
+        self.stdout.write(f"Restart worker running; SIGTERM lets running restarts finish for up to {grace:.0f}s")
+        asyncio.run(run_restart_worker(grace))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from accounts.notifications import dispatch, queue_reminders, reminder_lead_time
+
+
+class Command(BaseCommand):
+    help = 'Queue booking reminders and send pending notification emails (run from cron, or with --loop)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running instead of a single pass')
+        parser.add_argument('--interval', type=int, default=60, help='Seconds between passes with --loop')
+        parser.add_argument('--batch-size', type=int, help='Messages per send_messages call')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Sending reminders {reminder_lead_time()} before bookings start")
+        while True:
+            queued = queue_reminders()
+            counts = dispatch(batch_size=options['batch_size'])
+            self.stdout.write("due reminders {queued}, sent {sent}, failed {failed}, skipped {skipped}".format(queued=queued, **counts))
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
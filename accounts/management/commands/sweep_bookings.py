@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.utils import timezone
+
+from accounts import audit
+from accounts.coordination import get_coordinator, LockTimeout
+from accounts.db import run_write
+from accounts.models import Experiment, SessionBooking, WaitlistEntry
+from accounts.slots import build_gap_indexes
+from accounts.waitlist import expire_stale_entries, release_interval
+
+
+def _complete_finished(now):
+    """Mark active bookings that have ended as completed; return (id, user_id, exp_key) of those changed.
+
+    Runs as one write transaction, so no other writer can cancel or complete
+    a row between reading it and updating it.
+    """
+    finished = list(SessionBooking.objects.filter(status='active', end_time__lte=now).values_list(
+        'id', 'user_id', 'experiment__exp_key'
+    ))
+    SessionBooking.objects.filter(id__in=[b[0] for b in finished], status='active').update(status='completed')
+    return finished
+
+
+class Command(BaseCommand):
+    help = 'Complete finished bookings, expire stale waitlist entries and hand free time to waiters'
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+
+        finished = run_write(_complete_finished, now)
+        completed = len(finished)
+        for booking_id, user_id, exp_key in finished:
+            audit.record('booking_completed', user=user_id, exp_key=exp_key, booking=booking_id)
+        expired = expire_stale_entries(now)
+
+        # Any free gap inside a waiting window is a release: bookings removed by
+        # staff, holds that lapsed, or cancellations that found no fit earlier.
+        assigned = 0
+        busy = []
+        experiments = list(Experiment.objects.filter(waitlist_entries__status='waiting').distinct())
+        if experiments:
+            horizon = WaitlistEntry.objects.filter(status='waiting').aggregate(Max('window_end'))['window_end__max']
+            indexes = build_gap_indexes(experiments, now, horizon)
+            for experiment in experiments:
+                # Same lock as book_session and hold_slot, so a gap can't be filled
+                # from the waitlist while a user is booking or holding it
+                try:
+                    with get_coordinator().lock(f"booking:{experiment.exp_key}"):
+                        for start, end in indexes[experiment.exp_key].gaps:
+                            entries = run_write(release_interval, experiment, start, end)
+                            audit.record_waitlist_bookings(entries)
+                            assigned += len(entries)
+                except LockTimeout:
+                    busy.append(experiment.exp_key)
+
+        self.stdout.write(f"Completed {completed} bookings, expired {expired} waitlist entries, assigned {assigned}")
+        if busy:
+            self.stdout.write(f"Skipped busy experiments (retry next run): {', '.join(busy)}")
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_alter_experiment_options_experiment_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window_start', models.DateTimeField()),
+                ('window_end', models.DateTimeField()),
+                ('duration', models.PositiveIntegerField(default=60)),
+                ('status', models.CharField(choices=[('waiting', 'Waiting'), ('assigned', 'Assigned'), ('cancelled', 'Cancelled'), ('expired', 'Expired')], default='waiting', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='sessionbooking',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='sessionbooking',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'active')), fields=('experiment', 'start_time'), name='unique_active_booking_start'),
+        ),
+        migrations.AddField(
+            model_name='waitlistentry',
+            name='booking',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='waitlist_entry', to='accounts.sessionbooking'),
+        ),
+        migrations.AddField(
+            model_name='waitlistentry',
+            name='experiment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='accounts.experiment'),
+        ),
+        migrations.AddField(
+            model_name='waitlistentry',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='waitlistentry',
+            index=models.Index(fields=['experiment', 'status', 'created_at'], name='waitlist_queue_idx'),
+        ),
+    ]
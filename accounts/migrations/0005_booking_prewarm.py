@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_waitlist'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sessionbooking',
+            name='prewarm_status',
+            field=models.CharField(blank=True, choices=[('', 'Not started'), ('warming', 'Warming'), ('ready', 'Ready'), ('failed', 'Failed')], default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='sessionbooking',
+            name='prewarmed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='sessionbooking',
+            index=models.Index(fields=['status', 'start_time'], name='booking_status_start_idx'),
+        ),
+    ]
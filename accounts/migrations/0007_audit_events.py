@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_notifications'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('kind', models.CharField(choices=[('booking_created', 'Booking created'), ('booking_cancelled', 'Booking cancelled'), ('booking_completed', 'Booking completed'), ('restart_requested', 'Restart requested'), ('restart_started', 'Restart started'), ('restart_finished', 'Restart finished')], max_length=32)),
+                ('user_id', models.IntegerField(blank=True, null=True)),
+                ('exp_key', models.CharField(blank=True, max_length=50)),
+                ('booking_id', models.IntegerField(blank=True, null=True)),
+                ('data', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user_id', 'created_at'], name='audit_user_time_idx'), models.Index(fields=['exp_key', 'created_at'], name='audit_exp_time_idx'), models.Index(fields=['created_at'], name='audit_time_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_audit_events'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='waitlistentry',
+            index=models.Index(fields=['experiment', 'status', 'window_start'], name='waitlist_window_idx'),
+        ),
+    ]
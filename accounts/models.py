@@ -1,7 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.urls import reverse
 from django.utils import timezone
 from datetime import timedelta
+from .images import source_hash
 
 class User(AbstractUser):
     email = models.EmailField(unique=True)
@@ -10,6 +12,27 @@ class User(AbstractUser):
     
     def __str__(self):
         return self.username
+    
+    def avatar_url(self, size=64, ext='webp'):
+        """URL of a cached square thumbnail of the profile picture, or '' if there is none.
+
+        Pictures uploaded before normalisation existed have no thumbnails; for
+        them the 'jpg' URL is the original upload and the 'webp' URL is ''.
+        """
+        if not self.profile_pic:
+            return ''
+        digest = source_hash(self.profile_pic)
+        if digest is None:
+            return self.profile_pic.url if ext == 'jpg' else ''
+        return reverse('accounts:avatar', args=[digest, size, ext])
+    
+    @property
+    def avatar_webp(self):
+        return self.avatar_url(64, 'webp')
+    
+    @property
+    def avatar_jpeg(self):
+        return self.avatar_url(64, 'jpg')
 
 
 class Experiment(models.Model):
@@ -42,17 +65,36 @@ class SessionBooking(models.Model):
         ('completed', 'Completed'),
         ('cancelled', 'Cancelled'),
     ]
+    PREWARM_CHOICES = [
+        ('', 'Not started'),
+        ('warming', 'Warming'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bookings')
     experiment = models.ForeignKey(Experiment, on_delete=models.CASCADE, related_name='bookings')
     start_time = models.DateTimeField()
     end_time = models.DateTimeField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
+    prewarm_status = models.CharField(max_length=20, choices=PREWARM_CHOICES, default='', blank=True)
+    prewarmed_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['start_time']
-        unique_together = ['experiment', 'start_time']  # Prevent double-booking same slot
+        indexes = [
+            # Upcoming-bookings scans (pre-warm scheduler, reminders)
+            models.Index(fields=['status', 'start_time'], name='booking_status_start_idx'),
+        ]
+        constraints = [
+            # Prevent double-booking same slot; cancelled rows don't block re-booking it
+            models.UniqueConstraint(
+                fields=['experiment', 'start_time'],
+                condition=models.Q(status='active'),
+                name='unique_active_booking_start',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.experiment.name} ({self.start_time})"
@@ -68,8 +110,117 @@ class SessionBooking(models.Model):
             return max(0, int(delta.total_seconds() / 60))
         return 0
 
+    @property
+    def is_warm(self):
+        """True if the testbed was readied for this booking ahead of time."""
+        return self.prewarm_status == 'ready'
+
     @property
     def duration(self):
         """Return total duration of booking in minutes."""
         delta = self.end_time - self.start_time
-        return int(delta.total_seconds() / 60)
\ No newline at end of file
+        return int(delta.total_seconds() / 60)
+
+
+class WaitlistEntry(models.Model):
+    """A user queued for any free interval of an experiment inside a time window."""
+    STATUS_CHOICES = [
+        ('waiting', 'Waiting'),
+        ('assigned', 'Assigned'),
+        ('cancelled', 'Cancelled'),
+        ('expired', 'Expired'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='waitlist_entries')
+    experiment = models.ForeignKey(Experiment, on_delete=models.CASCADE, related_name='waitlist_entries')
+    window_start = models.DateTimeField()
+    window_end = models.DateTimeField()
+    duration = models.PositiveIntegerField(default=60)  # Minutes
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='waiting')
+    booking = models.OneToOneField(SessionBooking, on_delete=models.SET_NULL, null=True, blank=True, related_name='waitlist_entry')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            # Queue order per experiment (dashboard, admin)
+            models.Index(fields=['experiment', 'status', 'created_at'], name='waitlist_queue_idx'),
+            # The matcher probes the windows that can overlap a freed interval
+            models.Index(fields=['experiment', 'status', 'window_start'], name='waitlist_window_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} waiting for {self.experiment.name} ({self.window_start} - {self.window_end})"
+
+
+
+class Notification(models.Model):
+    """An email owed to a user; the row doubles as the idempotent sent-marker."""
+    KIND_CHOICES = [
+        ('reminder', 'Booking reminder'),
+        ('cancelled', 'Booking cancelled'),
+        ('waitlist_assigned', 'Waitlist slot assigned'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+        ('skipped', 'Skipped'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    booking = models.ForeignKey(SessionBooking, on_delete=models.CASCADE, related_name='notifications')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.CharField(max_length=255, blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            # Dispatcher picks up due rows in this order
+            models.Index(fields=['status', 'next_attempt_at'], name='notification_due_idx'),
+        ]
+        constraints = [
+            # At most one email of each kind per booking, however often it is queued
+            models.UniqueConstraint(fields=['booking', 'kind'], name='unique_booking_notification'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} for {self.user.username} ({self.status})"
+
+
+class AuditEvent(models.Model):
+    """Append-only record of booking and restart activity (written by accounts.audit)."""
+    KIND_CHOICES = [
+        ('booking_created', 'Booking created'),
+        ('booking_cancelled', 'Booking cancelled'),
+        ('booking_completed', 'Booking completed'),
+        ('restart_requested', 'Restart requested'),
+        ('restart_started', 'Restart started'),
+        ('restart_finished', 'Restart finished'),
+    ]
+    
+    created_at = models.DateTimeField()
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES)
+    # Plain ids rather than foreign keys so history outlives deleted rows
+    user_id = models.IntegerField(null=True, blank=True)
+    exp_key = models.CharField(max_length=50, blank=True)
+    booking_id = models.IntegerField(null=True, blank=True)
+    data = models.JSONField(default=dict, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Staff audit queries: by user, by experiment, or by time range alone
+            models.Index(fields=['user_id', 'created_at'], name='audit_user_time_idx'),
+            models.Index(fields=['exp_key', 'created_at'], name='audit_exp_time_idx'),
+            models.Index(fields=['created_at'], name='audit_time_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.created_at:%Y-%m-%d %H:%M:%S} {self.kind} {self.exp_key}"
@@ -0,0 +1,215 @@
+"""Booking reminder and cancellation emails, sent in batches from an outbox.
+
+Anything that owes a user an email inserts a ``Notification`` row (inside
+the transaction that caused it, so the email can't be lost or sent for a
+rolled-back change). ``dispatch`` later claims due rows, renders them and
+sends them over a single SMTP connection with ``send_messages``; the
+unique (booking, kind) constraint makes queueing idempotent, and failed
+rows are retried with backoff until ``NOTIFICATION_MAX_ATTEMPTS``.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Notification, SessionBooking
+
+logger = logging.getLogger(__name__)
+
+# A row stuck in 'sending' this long belongs to a dispatcher that died mid-batch
+SENDING_TIMEOUT = timedelta(minutes=10)
+
+# Kinds that announce an upcoming session; pointless once the booking is cancelled
+ACTIVE_BOOKING_KINDS = ('reminder', 'waitlist_assigned')
+
+SUBJECTS = {
+    'reminder': "Reminder: {exp} starts at {start:%H:%M}",
+    'cancelled': "Booking cancelled: {exp} at {start:%Y-%m-%d %H:%M}",
+    'waitlist_assigned': "A slot opened up: {exp} at {start:%Y-%m-%d %H:%M}",
+}
+BODIES = {
+    'reminder': (
+        "Hi {user},\n\nYour session on {exp} starts at {start:%Y-%m-%d %H:%M} and runs until "
+        "{end:%H:%M}.\nStart it from the booking dashboard when it's time.\n"
+    ),
+    'cancelled': (
+        "Hi {user},\n\nYour booking of {exp} from {start:%Y-%m-%d %H:%M} to {end:%H:%M} "
+        "has been cancelled.\n"
+    ),
+    'waitlist_assigned': (
+        "Hi {user},\n\nYou were on the waitlist for {exp}, and a slot has been booked for you "
+        "from {start:%Y-%m-%d %H:%M} to {end:%H:%M}.\nCancel it from the booking dashboard "
+        "if you no longer need it.\n"
+    ),
+}
+
+
+class ConnectionLost(Exception):
+    """The SMTP connection dropped mid-batch; args[0] holds that batch's errors."""
+
+
+def reminder_lead_time():
+    """How long before a booking starts its reminder is sent."""
+    return timedelta(minutes=getattr(settings, 'REMINDER_LEAD_MINUTES', 30))
+
+
+def max_attempts():
+    return getattr(settings, 'NOTIFICATION_MAX_ATTEMPTS', 5)
+
+
+def enqueue(kind, booking):
+    """Queue one email about booking; a no-op if it was already queued."""
+    Notification.objects.bulk_create(
+        [Notification(user_id=booking.user_id, booking=booking, kind=kind)], ignore_conflicts=True
+    )
+
+
+def queue_reminders(now=None):
+    """Queue reminders for active bookings starting within the lead time; return how many were due.
+
+    One range query on booking_status_start_idx plus one insert; bookings
+    already reminded are skipped by the unique constraint.
+    """
+    now = now or timezone.now()
+    due = SessionBooking.objects.filter(
+        status='active',
+        start_time__gt=now,
+        start_time__lte=now + reminder_lead_time(),
+    ).values_list('id', 'user_id')
+    rows = [Notification(user_id=user_id, booking_id=booking_id, kind='reminder') for booking_id, user_id in due]
+    Notification.objects.bulk_create(rows, ignore_conflicts=True, batch_size=500)
+    return len(rows)
+
+
+def _skip_stale(now):
+    """Mark due reminders whose booking is no longer active as 'skipped'; return how many."""
+    return Notification.objects.filter(
+        status='pending', next_attempt_at__lte=now, kind__in=ACTIVE_BOOKING_KINDS,
+    ).exclude(booking__status='active').update(status='skipped', last_error='booking no longer active')
+
+
+def _requeue_abandoned(now):
+    Notification.objects.filter(
+        status='sending', next_attempt_at__lte=now - SENDING_TIMEOUT
+    ).update(status='pending')
+
+
+def _claim(now, limit):
+    """Mark up to limit due rows as 'sending' and return them, ready to render."""
+    ids = list(Notification.objects.filter(
+        status='pending', next_attempt_at__lte=now
+    ).order_by('next_attempt_at').values_list('id', flat=True)[:limit])
+    # Only rows still pending are ours if another dispatcher raced us
+    Notification.objects.filter(id__in=ids, status='pending').update(
+        status='sending', next_attempt_at=now, attempts=F('attempts') + 1
+    )
+    return list(Notification.objects.filter(
+        id__in=ids, status='sending', next_attempt_at=now
+    ).select_related('user', 'booking__experiment'))
+
+
+def render(notification):
+    """Build the EmailMessage for a notification row."""
+    booking = notification.booking
+    context = {
+        'user': notification.user.first_name or notification.user.username,
+        'exp': booking.experiment.name,
+        'start': timezone.localtime(booking.start_time),
+        'end': timezone.localtime(booking.end_time),
+    }
+    return EmailMessage(
+        subject=SUBJECTS[notification.kind].format(**context),
+        body=BODIES[notification.kind].format(**context),
+        to=[notification.user.email],
+    )
+
+
+def _send_batch(connection, batch):
+    """Send batch over the open connection; return {id: error} for the rows that failed.
+
+    Messages go to the backend one list item at a time: SMTP costs one
+    MAIL/RCPT/DATA exchange per message either way, and a refused recipient
+    would otherwise abort the rest of the list without saying which
+    messages already went out (a blind resend would duplicate them).
+    """
+    errors = {}
+    for position, notification in enumerate(batch):
+        try:
+            connection.send_messages([render(notification)])
+        except Exception as exc:
+            errors[notification.id] = str(exc)[:255] or exc.__class__.__name__
+            # The server may have dropped us; reopen so later sends keep sharing one connection
+            connection.close()
+            try:
+                connection.open()
+            except Exception:
+                for rest in batch[position + 1:]:
+                    errors[rest.id] = 'connection lost'
+                raise ConnectionLost(errors)
+    return errors
+
+
+def _record(batch, errors, now):
+    sent = [n.id for n in batch if n.id not in errors]
+    Notification.objects.filter(id__in=sent).update(status='sent', sent_at=now, last_error='')
+    for notification in batch:
+        error = errors.get(notification.id)
+        if error is None:
+            continue
+        exhausted = notification.attempts >= max_attempts()
+        Notification.objects.filter(id=notification.id).update(
+            status='failed' if exhausted else 'pending',
+            last_error=error,
+            # Back off 1, 2, 4, ... minutes between attempts
+            next_attempt_at=now + timedelta(minutes=2 ** (notification.attempts - 1)),
+        )
+    return len(sent)
+
+
+def dispatch(now=None, batch_size=None, limit=5000):
+    """Send every due notification; return {'sent': n, 'failed': n, 'skipped': n}.
+
+    Rows are claimed and marked in batches of NOTIFICATION_BATCH_SIZE, and
+    all of them share one SMTP connection that is opened once; a refused
+    message only costs itself a retry, not the rest of its batch.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or getattr(settings, 'NOTIFICATION_BATCH_SIZE', 100)
+    _requeue_abandoned(now)
+    counts = {'sent': 0, 'failed': 0, 'skipped': _skip_stale(now)}
+    claimed = _claim(now, limit)
+    # A booking cancelled between the sweep above and the claim
+    stale = [n.id for n in claimed if n.kind in ACTIVE_BOOKING_KINDS and n.booking.status != 'active']
+    if stale:
+        counts['skipped'] += Notification.objects.filter(id__in=stale).update(
+            status='skipped', last_error='booking no longer active'
+        )
+        claimed = [n for n in claimed if n.id not in stale]
+    if not claimed:
+        return counts
+
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+        for i in range(0, len(claimed), batch_size):
+            batch = claimed[i:i + batch_size]
+            try:
+                errors = _send_batch(connection, batch)
+            except ConnectionLost as exc:
+                counts['sent'] += _record(batch, exc.args[0], now)
+                raise
+            counts['sent'] += _record(batch, errors, now)
+            counts['failed'] += len(errors)
+    except Exception:
+        # Couldn't (re)connect: give everything not yet recorded back for the next run
+        logger.exception("Notification dispatch aborted")
+        Notification.objects.filter(id__in=[n.id for n in claimed], status='sending').update(
+            status='pending', last_error='connection failed'
+        )
+    finally:
+        connection.close()
+    logger.info("Notifications: %(sent)d sent, %(failed)d failed, %(skipped)d skipped", counts)
+    return counts
@@ -0,0 +1,173 @@
+"""Dependency-aware restart of multi-component testbeds.
+
+A plan is a list of Steps forming a DAG. Each step runs its command once
+all of its prerequisites are *ready*, then polls its own readiness check
+until it passes, so independent components come up in parallel and
+dependents start the moment their prerequisites answer instead of after a
+fixed sleep. Every step records its timings for the status endpoint.
+
+Commands and readiness probes run under timeouts (``Step.timeout`` and
+``Step.ready_timeout``); a process that overruns is killed and its step
+recorded as failed, so a hung ssh can't stall the plan forever.
+"""
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Step:
+    """One component action in a restart plan."""
+
+    def __init__(self, name, command, requires=(), ready=None, ready_timeout=300, poll_interval=1.0, timeout=300):
+        self.name = name
+        self.command = list(command)
+        self.timeout = timeout  # seconds the command may run before it is killed
+        self.requires = tuple(requires)
+        self.ready = list(ready) if ready else None  # argv polled until it exits 0
+        self.ready_timeout = ready_timeout
+        self.poll_interval = poll_interval
+
+    def __repr__(self):
+        return f"Step({self.name!r}, requires={self.requires!r})"
+
+
+class PlanError(ValueError):
+    """Raised for plans with unknown prerequisites or dependency cycles."""
+
+
+def validate_plan(steps):
+    """Check that step names are unique, prerequisites exist and there is no cycle."""
+    by_name = {}
+    for step in steps:
+        if step.name in by_name:
+            raise PlanError(f"Duplicate step {step.name!r}")
+        by_name[step.name] = step
+    for step in steps:
+        for dep in step.requires:
+            if dep not in by_name:
+                raise PlanError(f"Step {step.name!r} requires unknown step {dep!r}")
+
+    visiting, done = set(), set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise PlanError(f"Dependency cycle through {name!r}")
+        visiting.add(name)
+        for dep in by_name[name].requires:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+
+    for name in by_name:
+        visit(name)
+    return by_name
+
+
+async def run_command(argv, timeout=None):
+    """Run argv; return (returncode, stderr). Kills it and raises asyncio.TimeoutError after timeout seconds."""
+    proc = await asyncio.create_subprocess_exec(
+        *argv, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        _, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        # Also on cancellation, so an abandoned plan leaves no stray ssh behind
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        raise
+    return proc.returncode, stderr
+
+
+async def _wait_ready(step):
+    """Poll step.ready until it succeeds; return False on timeout."""
+    if not step.ready:
+        return True
+    deadline = time.monotonic() + step.ready_timeout
+    while True:
+        try:
+            # A hung probe may only use up what is left of ready_timeout
+            returncode, _ = await run_command(step.ready, timeout=max(deadline - time.monotonic(), 0.1))
+        except asyncio.TimeoutError:
+            return False
+        if returncode == 0:
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(step.poll_interval)
+
+
+async def run_plan(steps, on_update=None):
+    """Run a restart plan and return {step name: timing/status dict}.
+
+    ``on_update(results)`` is called after every state change so callers can
+    publish progress while the plan is still running.
+    """
+    by_name = validate_plan(steps)
+    ready_events = {name: asyncio.Event() for name in by_name}
+    results = {name: {'status': 'pending'} for name in by_name}
+    origin = time.monotonic()
+
+    def update(name, **fields):
+        results[name].update(fields)
+        if on_update:
+            on_update(results)
+
+    async def run_step(step):
+        for dep in step.requires:
+            await ready_events[dep].wait()
+        failed = [dep for dep in step.requires if results[dep]['status'] != 'ready']
+        if failed:
+            update(step.name, status='skipped', reason=f"prerequisite failed: {', '.join(failed)}")
+            ready_events[step.name].set()
+            return
+
+        update(step.name, status='running', started=round(time.monotonic() - origin, 3))
+        reason = None
+        try:
+            returncode, stderr = await run_command(step.command, timeout=step.timeout)
+        except asyncio.TimeoutError:  # an OSError subclass, so caught first
+            returncode, stderr = None, b''
+            reason = f'command timed out after {step.timeout}s'
+        except OSError as e:
+            returncode, stderr = None, str(e).encode()
+        finished = round(time.monotonic() - origin, 3)
+        if returncode != 0:
+            logger.error("Restart step %s failed (exit %s): %s", step.name, returncode, reason or stderr[-500:])
+            update(step.name, status='failed', returncode=returncode, finished=finished,
+                   **({'reason': reason} if reason else {}))
+            ready_events[step.name].set()
+            return
+
+        update(step.name, status='waiting_ready', returncode=0, finished=finished)
+        is_ready = await _wait_ready(step)
+        update(
+            step.name,
+            status='ready' if is_ready else 'failed',
+            ready_at=round(time.monotonic() - origin, 3),
+            **({} if is_ready else {'reason': 'readiness check timed out'}),
+        )
+        ready_events[step.name].set()
+
+    await asyncio.gather(*(run_step(step) for step in steps))
+    logger.info("Restart plan finished in %.1fs: %s", time.monotonic() - origin,
+                {name: r['status'] for name, r in results.items()})
+    return results
+
+
+def plan_succeeded(results):
+    """True if every step of a finished plan reached 'ready'."""
+    return all(r['status'] == 'ready' for r in results.values())
+
+
+def first_failure(results):
+    """Return (name, result) of the step that failed first, or (None, None) if none failed."""
+    failed = [(r.get('finished', 0), name) for name, r in results.items() if r['status'] == 'failed']
+    if not failed:
+        return None, None
+    name = min(failed)[1]
+    return name, results[name]
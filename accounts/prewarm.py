@@ -0,0 +1,95 @@
+"""Restart testbeds shortly before a booking starts so start_experiment can redirect at once."""
+import asyncio
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import audit
+from .models import SessionBooking
+from .services import arestart, has_restart
+
+logger = logging.getLogger(__name__)
+
+
+def lead_time():
+    """How long before a booking starts its testbed is restarted."""
+    return timedelta(minutes=getattr(settings, 'PREWARM_LEAD_MINUTES', 10))
+
+
+def due_bookings(now):
+    """Active, not yet warmed bookings starting within the lead time (one query on booking_status_start_idx)."""
+    return list(SessionBooking.objects.filter(
+        status='active',
+        start_time__gt=now,
+        start_time__lte=now + lead_time(),
+        prewarm_status='',
+    ).select_related('experiment'))
+
+
+def continues_previous(booking):
+    """True if the same user has a booking on the same testbed ending right before this one."""
+    gap = timedelta(minutes=getattr(settings, 'PREWARM_BACK_TO_BACK_MINUTES', 5))
+    return SessionBooking.objects.filter(
+        experiment_id=booking.experiment_id,
+        user_id=booking.user_id,
+        status__in=['active', 'completed'],
+        end_time__gte=booking.start_time - gap,
+        end_time__lte=booking.start_time,
+    ).exists()
+
+
+def in_use_by_other(booking, now):
+    """True if another user's session is running on the testbed right now."""
+    return SessionBooking.objects.filter(
+        experiment_id=booking.experiment_id,
+        status='active',
+        start_time__lte=now,
+        end_time__gt=now,
+    ).exclude(user_id=booking.user_id).exists()
+
+
+def _claim(booking, status):
+    """Move booking from not-started to status; False if another scheduler run got it first."""
+    return SessionBooking.objects.filter(id=booking.id, prewarm_status='').update(
+        prewarm_status=status, prewarmed_at=timezone.now()
+    ) == 1
+
+
+def run_prewarm(now=None):
+    """Warm every due testbed once; return {'warmed': n, 'failed': n, 'skipped': n, 'deferred': n}."""
+    now = now or timezone.now()
+    counts = {'warmed': 0, 'failed': 0, 'skipped': 0, 'deferred': 0}
+    to_warm = []
+    for booking in due_bookings(now):
+        exp_key = booking.experiment.exp_key
+        if not has_restart(exp_key):
+            continue
+        if continues_previous(booking):
+            # Back-to-back by the same user: the testbed is already theirs and running
+            if _claim(booking, 'ready'):
+                counts['skipped'] += 1
+            continue
+        if in_use_by_other(booking, now):
+            # Never restart under someone else's session; retried on the next run
+            counts['deferred'] += 1
+            continue
+        if _claim(booking, 'warming'):
+            audit.record('restart_requested', exp_key=exp_key, booking=booking, via='prewarm')
+            to_warm.append(booking)
+
+    if not to_warm:
+        return counts
+
+    async def warm_all():
+        return await asyncio.gather(*(arestart(b.experiment.exp_key) for b in to_warm))
+
+    for booking, ok in zip(to_warm, asyncio.run(warm_all())):
+        SessionBooking.objects.filter(id=booking.id).update(
+            prewarm_status='ready' if ok else 'failed', prewarmed_at=timezone.now()
+        )
+        counts['warmed' if ok else 'failed'] += 1
+        logger.info("Pre-warm of %s for booking %s: %s", booking.experiment.exp_key, booking.id,
+                    'ready' if ok else 'failed')
+    return counts
@@ -0,0 +1,192 @@
+"""Token-bucket rate limiting for restart and booking endpoints.
+
+Limits live in ``settings.RATE_LIMITS`` as ``{scope: {dimension: "N/period"}}``
+where dimension is ``user``, ``exp`` (the ``exp`` request parameter if it
+names an experiment, or what the view's ``exp_key`` function returns) or ``all`` (the endpoint as
+a whole), and N requests may burst before the bucket refills at N per
+period. A request only takes tokens if every bucket it hits has one, so a
+rejected request doesn't drain the others. The default in-process buckets
+cost a dict lookup under a lock but are per worker. ``RATE_LIMIT_BACKEND =
+'coordination'`` (the manage-p5g.py default) keeps exact buckets in the
+coordination backend so all workers share them; ``'cache'`` approximates
+them with counters in a shared cache.
+"""
+import functools
+import math
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from .coordination import get_coordinator
+from .models import Experiment
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Buckets that have refilled are dropped once the table grows past this size
+# (and then only each time it doubles, so pruning stays amortised O(1))
+MAX_LOCAL_BUCKETS = 10000
+
+
+@functools.lru_cache(maxsize=None)
+def parse_rate(spec):
+    """Turn "N/period" into (tokens per second, burst size)."""
+    count, period = spec.split('/')
+    burst = int(count)
+    return burst / PERIODS[period[-1]] / int(period[:-1] or 1), burst
+
+
+class LocalBuckets:
+    """Token buckets kept in this process."""
+
+    def __init__(self):
+        self._buckets = {}  # key -> (tokens, last update, time it is full again)
+        self._lock = threading.Lock()
+        self._prune_at = MAX_LOCAL_BUCKETS
+
+    def take(self, specs):
+        """Take one token from each (key, rate, burst) bucket if all have one.
+
+        Return 0 if allowed, else seconds until every bucket has a token;
+        a rejected request leaves every bucket (and the table) untouched.
+        """
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            wait = 0.0
+            for key, rate, burst in specs:
+                tokens, last, _ = self._buckets.get(key, (burst, now, now))
+                tokens = min(burst, tokens + (now - last) * rate)
+                levels.append((key, tokens, rate, burst))
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+            if wait:
+                return wait
+            for key, tokens, rate, burst in levels:
+                self._buckets[key] = (tokens - 1, now, now + (burst - tokens + 1) / rate)
+            if len(self._buckets) > self._prune_at:
+                self._prune(now)
+        return 0.0
+
+    def _prune(self, now):
+        """Drop buckets that have refilled; a missing bucket counts as full."""
+        self._buckets = {k: v for k, v in self._buckets.items() if v[2] > now}
+        self._prune_at = max(MAX_LOCAL_BUCKETS, 2 * len(self._buckets))
+
+
+_local = LocalBuckets()
+
+
+def _cache_take(specs):
+    """Fixed-window approximation of the buckets using shared cache counters.
+
+    Counts are read first and only incremented if every window has room;
+    two workers racing on the last slot may both get in.
+    """
+    now = time.time()
+    windows = []
+    for key, rate, burst in specs:
+        window = burst / rate
+        slot = int(now // window)
+        windows.append((f"rl:{key}:{slot}", burst, (slot + 1) * window - now, math.ceil(window) + 1))
+    counts = cache.get_many([w[0] for w in windows])
+    wait = max((remaining for cache_key, burst, remaining, _ in windows
+                if counts.get(cache_key, 0) >= burst), default=0.0)
+    if wait:
+        return wait
+    for cache_key, _, _, ttl in windows:
+        cache.add(cache_key, 0, ttl)
+        try:
+            cache.incr(cache_key)
+        except ValueError:  # evicted between add and incr
+            cache.set(cache_key, 1, ttl)
+    return 0.0
+
+
+def check(scope, user_id, exp_key):
+    """Apply every configured limit for scope; return 0 if allowed, else Retry-After seconds."""
+    limits = getattr(settings, 'RATE_LIMITS', {}).get(scope)
+    if not limits:
+        return 0.0
+    backend = getattr(settings, 'RATE_LIMIT_BACKEND', 'local')
+    if backend == 'coordination':
+        take = get_coordinator().take_tokens
+    elif backend == 'cache':
+        take = _cache_take
+    else:
+        take = _local.take
+    values = {'user': user_id, 'exp': exp_key, 'all': ''}
+    specs = [
+        (f"{scope}:{dimension}:{values[dimension]}", *parse_rate(spec))
+        for dimension, spec in limits.items()
+        if values.get(dimension) is not None
+    ]
+    return take(specs) if specs else 0.0
+
+
+def _too_many(retry_after):
+    response = HttpResponse("Too many requests, please slow down.", status=429)
+    response['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+
+class RateLimited(Exception):
+    """Raised by enforce; args[0] is the Retry-After in seconds."""
+
+    def response(self):
+        return _too_many(self.args[0])
+
+
+def enforce(scope, user_id, exp_key=None):
+    """Like check, but raise RateLimited instead of returning a wait.
+
+    For charging a limit from inside an operation rather than per request,
+    e.g. as the ``before_start`` of ``services.start_restart``.
+    """
+    retry_after = check(scope, user_id, exp_key)
+    if retry_after:
+        raise RateLimited(retry_after)
+
+
+def _param_exp_key(request, *args, **kwargs):
+    exp = request.POST.get('exp') or request.GET.get('exp')
+    # Made-up values get no bucket, so they can't grow the bucket table
+    if exp and Experiment.objects.filter(exp_key=exp).exists():
+        return exp
+    return None
+
+
+def rate_limit(scope, exp_key=_param_exp_key):
+    """Reject requests over the RATE_LIMITS[scope] limits with 429 and Retry-After.
+
+    ``exp_key(request, *args, **kwargs)`` names the experiment for the
+    ``exp`` dimension (default: the ``exp`` parameter); on async views it
+    may be a coroutine function. Works on sync and async views; place it
+    under ``login_required``.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            async def wrapper(request, *args, **kwargs):
+                user = await request.auser()
+                if iscoroutinefunction(exp_key):
+                    exp = await exp_key(request, *args, **kwargs)
+                else:
+                    exp = await sync_to_async(exp_key)(request, *args, **kwargs)
+                if getattr(settings, 'RATE_LIMIT_BACKEND', 'local') == 'local':
+                    retry_after = check(scope, user.pk, exp)
+                else:  # shared backends do blocking I/O
+                    retry_after = await sync_to_async(check, thread_sensitive=False)(scope, user.pk, exp)
+                if retry_after:
+                    return _too_many(retry_after)
+                return await view(request, *args, **kwargs)
+        else:
+            def wrapper(request, *args, **kwargs):
+                retry_after = check(scope, request.user.pk, exp_key(request, *args, **kwargs))
+                if retry_after:
+                    return _too_many(retry_after)
+                return view(request, *args, **kwargs)
+        return functools.wraps(view)(wrapper)
+    return decorator
@@ -0,0 +1,78 @@
+"""Restart plans for the OAI testbeds, mirroring core_restart.sh as a DAG.
+
+core_restart.sh brings the core down and up, then starts gNB and both UEs
+in one go. Here the gNB starts as soon as the AMF/SMF/UPF report healthy,
+and the two UEs start in parallel once the gNB has completed NG setup.
+Experiments without a plan fall back to their restart script.
+"""
+from .orchestrator import Step
+
+OAI_DIR = "oai-workshops/cn"
+
+
+def _ssh(host, command):
+    # ConnectTimeout so an unreachable VM fails the step instead of waiting on TCP
+    return ['ssh', '-o', 'BatchMode=yes', '-o', 'ConnectTimeout=10', f'core@{host}', f'cd {OAI_DIR} && {command}']
+
+
+def oai_plan(host, gnb=False, ues=()):
+    """Build the core[/gNB[/UE]] restart plan for the OAI VM at host."""
+    steps = [
+        Step('core_down', _ssh(host, 'sudo docker compose -f docker-compose.yml down')),
+        Step(
+            'core_up', _ssh(host, 'sudo docker compose -f docker-compose.yml up -d'),
+            requires=['core_down'],
+            ready=_ssh(host, 'test "$(sudo docker inspect -f "{{.State.Health.Status}}" '
+                             'oai-amf oai-smf oai-upf | sort -u)" = healthy'),
+            poll_interval=2.0,
+        ),
+    ]
+    if gnb:
+        steps.append(Step(
+            'gnb_up', _ssh(host, 'sudo docker compose -f docker-compose-ran.yml up -d oai-gnb'),
+            requires=['core_up'],
+            ready=_ssh(host, 'sudo docker logs oai-gnb 2>&1 | grep -q NGSetupResponse'),
+            poll_interval=2.0,
+        ))
+    for ue in ues:
+        steps.append(Step(
+            f'{ue}_up', _ssh(host, f'sudo docker compose -f docker-compose-ran.yml up -d {ue}'),
+            requires=['gnb_up'],
+            # The tunnel interface appears once the PDU session is established
+            ready=_ssh(host, f'sudo docker exec {ue} ip addr show oaitun_ue1'),
+            poll_interval=2.0,
+        ))
+    return steps
+
+
+RESTART_PLANS = {
+    "exp1": lambda: oai_plan("10.7.43.10"),
+    "exp2": lambda: oai_plan("10.7.43.11", gnb=True),
+    "exp3": lambda: oai_plan("10.7.43.12", gnb=True, ues=('oai-nr-ue', 'oai-nr-ue2')),
+}
+
+# Rough per-step durations (seconds) used by the local stand-in plan
+STAND_IN_SECONDS = {'core_down': 1.0, 'core_up': 2.0, 'gnb_up': 1.5}
+STAND_IN_DEFAULT = 1.0
+
+
+def get_plan(exp_key):
+    """Return a fresh list of Steps for exp_key, or None if it only has a script."""
+    factory = RESTART_PLANS.get(exp_key)
+    return factory() if factory else None
+
+
+def stand_in_plan(steps, scale=1.0):
+    """Replace remote commands with local sleeps of the same shape, for testing and benchmarks."""
+    return [
+        Step(
+            step.name,
+            ['sleep', str(STAND_IN_SECONDS.get(step.name, STAND_IN_DEFAULT) * scale)],
+            requires=step.requires,
+            ready=['true'] if step.ready else None,
+            ready_timeout=step.ready_timeout,
+            poll_interval=0.05,
+            timeout=step.timeout,
+        )
+        for step in steps
+    ]
@@ -0,0 +1,488 @@
+import asyncio
+import logging
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from . import audit
+from .coordination import get_coordinator, new_owner
+from .orchestrator import first_failure, plan_succeeded, run_command, run_plan
+from .restart_plans import get_plan
+
+logger = logging.getLogger(__name__)
+
+# Map experiment keys to their target UI URL and local restart script (relative to BASE_DIR)
+SERVICE_MAP = {
+    "exp1": {"url": "http://10.7.43.10", "script": "scripts/restart_oai_core.sh"},
+    "exp2": {"url": "http://10.7.43.11", "script": "scripts/restart_gnb.sh"},
+    "exp3": {"url": "http://10.7.43.12", "script": "scripts/restart_ue.sh"},
+    "exp4": {"url": "http://10.7.43.13", "script": "scripts/restart_open5gs.sh"},
+    "exp5": {"url": "http://10.7.43.14", "script": "scripts/restart_free5gc.sh"},
+}
+if getattr(settings, "TESTBED_URL_OVERRIDE", None):
+    SERVICE_MAP = {key: dict(entry, url=settings.TESTBED_URL_OVERRIDE) for key, entry in SERVICE_MAP.items()}
+
+# Seconds to wait for a testbed UI to answer a status probe
+PROBE_TIMEOUT = 2.0
+# Probes every testbed at once for the sync status view
+_probe_pool = ThreadPoolExecutor(max_workers=len(SERVICE_MAP), thread_name_prefix='probe')
+PROBE_CACHE_KEY = "service-probe"
+
+# Last known restart state per experiment, shared by the sync and async runners
+# and mirrored to other worker processes over the coordinator
+_restart_state = {}
+_state_lock = threading.Lock()
+_subscribed = False
+
+# Strong references to in-flight restart tasks so the event loop doesn't drop them
+_background_tasks = set()
+# Threads running restarts started from sync views, for wait_for_restarts
+_restart_threads = set()
+_threads_lock = threading.Lock()
+
+# How often a running restart renews its lease
+RESTART_HEARTBEAT_SECONDS = 10
+
+# Publishes restart state for coroutines, in order, off the event loop
+_mark_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='restart-state')
+
+
+def resolve_script(exp_key):
+    """Return the absolute restart script path for exp_key if it is runnable, else None."""
+    script_rel = SERVICE_MAP.get(exp_key, {}).get("script")
+    if not script_rel:
+        return None
+    script_path = os.path.join(settings.BASE_DIR, script_rel)
+    if os.path.exists(script_path) and os.access(script_path, os.X_OK):
+        return script_path
+    return None
+
+
+def restart_lease_seconds():
+    """Upper bound on a restart; one still running after this is cancelled and its processes killed."""
+    return getattr(settings, 'RESTART_LEASE_SECONDS', 900)
+
+
+def restart_runner():
+    """'inline' runs restarts in the requesting process; 'worker' hands them to manage.py restart_worker."""
+    return getattr(settings, 'RESTART_RUNNER', 'inline')
+
+
+def _lease_ttl():
+    # A runner renews its lease every heartbeat, so one that dies frees the testbed within a few
+    return RESTART_HEARTBEAT_SECONDS * 3
+
+
+def _merge_state(message):
+    with _state_lock:
+        _restart_state.setdefault(message["exp"], {}).update(message["state"])
+
+
+def _ensure_subscribed():
+    global _subscribed
+    if not _subscribed:
+        _subscribed = True
+        get_coordinator().subscribe("restart-state", _merge_state)
+
+
+def _mark(exp_key, **state):
+    _ensure_subscribed()
+    get_coordinator().publish("restart-state", {"exp": exp_key, "state": state})
+    # Only the runners set status, so this is where restarts enter the audit trail
+    status = state.get("status")
+    if status == "running":
+        audit.record("restart_started", exp_key=exp_key)
+    elif status in ("succeeded", "failed"):
+        extra = {"failed_step": state["failed_step"]} if state.get("failed_step") else {}
+        audit.record("restart_finished", exp_key=exp_key, status=status,
+                     returncode=state.get("returncode"), duration=round(state.get("duration") or 0, 3), **extra)
+
+
+def _offload(fn, *args, **kwargs):
+    """Awaitable running fn in a thread: coordinator calls block on fcntl/SQLite/network I/O."""
+    return sync_to_async(fn, thread_sensitive=False)(*args, **kwargs)
+
+
+async def _amark(exp_key, **state):
+    """_mark from a coroutine without blocking the event loop."""
+    await asyncio.get_running_loop().run_in_executor(_mark_pool, partial(_mark, exp_key, **state))
+
+
+def restart_state(exp_key):
+    """Return a copy of the last recorded restart state for exp_key, from any worker.
+
+    A restart still reported as queued or running whose lease has lapsed lost
+    its runner (killed or recycled before it could report) and is reported
+    as 'abandoned'.
+    """
+    _ensure_subscribed()
+    with _state_lock:
+        state = dict(_restart_state.get(exp_key, {}))
+    if state and state.get("status") not in ("queued", "running"):
+        return state
+    if get_coordinator().holder(f"restart:{exp_key}"):
+        # Started by another worker before this one subscribed
+        state = state or {"status": "running"}
+    elif state:
+        state["status"] = "abandoned"
+    return state
+
+
+def _claim_restart(exp_key):
+    """Take exp_key's restart lease; return its owner token, or None if a restart is already running."""
+    owner = new_owner()
+    if get_coordinator().acquire(f"restart:{exp_key}", owner, _lease_ttl()):
+        return owner
+    logger.info("Restart of %s already in progress, not starting another", exp_key)
+    return None
+
+
+def _release_restart(exp_key, owner):
+    get_coordinator().release(f"restart:{exp_key}", owner)
+
+
+async def _arun_script(script_path, exp_key):
+    """Run restart script as a subprocess on the running event loop; return True on success."""
+    started = time.monotonic()
+    await _amark(exp_key, status="running", returncode=None, failed_step=None, steps=None)
+    try:
+        returncode, _ = await run_command(['bash', script_path])
+    except asyncio.CancelledError:
+        await _amark(exp_key, status="failed", returncode=None, duration=time.monotonic() - started)
+        logger.error("Restart script cancelled: %s", script_path)
+        raise
+    except Exception:
+        await _amark(exp_key, status="failed", returncode=None, duration=time.monotonic() - started)
+        logger.exception("Restart script failed: %s", script_path)
+        return False
+    status = "succeeded" if returncode == 0 else "failed"
+    await _amark(exp_key, status=status, returncode=returncode, duration=time.monotonic() - started)
+    if returncode == 0:
+        logger.info("Restart script succeeded: %s", script_path)
+    else:
+        logger.error("Restart script failed: %s (exit %s)", script_path, returncode)
+    return returncode == 0
+
+
+async def _arun_plan(steps, exp_key):
+    """Run an orchestrated restart plan, publishing per-step progress; return True on success."""
+    started = time.monotonic()
+    await _amark(exp_key, status="running", returncode=None, failed_step=None, steps=None)
+
+    def publish(results):
+        # Called synchronously by run_plan; the single-thread pool keeps updates in order
+        _mark_pool.submit(_mark, exp_key, steps={name: dict(r) for name, r in results.items()})
+
+    try:
+        results = await run_plan(steps, on_update=publish)
+    except asyncio.CancelledError:
+        # Cancelling run_plan kills the running step's process
+        await _amark(exp_key, status="failed", duration=time.monotonic() - started)
+        logger.error("Restart plan cancelled: %s", exp_key)
+        raise
+    except Exception:
+        await _amark(exp_key, status="failed", duration=time.monotonic() - started)
+        logger.exception("Restart plan failed: %s", exp_key)
+        return False
+    if plan_succeeded(results):
+        await _amark(exp_key, status="succeeded", returncode=0, duration=time.monotonic() - started)
+        return True
+    # A step that exited 0 but never became ready keeps returncode 0; failed_step says which
+    name, failure = first_failure(results)
+    await _amark(exp_key, status="failed", returncode=failure.get("returncode") if failure else None,
+          failed_step=name, duration=time.monotonic() - started)
+    return False
+
+
+def _restart_job(exp_key):
+    """Return a function creating exp_key's restart coroutine, or None if nothing is configured."""
+    steps = get_plan(exp_key)
+    if steps:
+        return lambda: _arun_plan(steps, exp_key)
+    script_path = resolve_script(exp_key)
+    if script_path:
+        return lambda: _arun_script(script_path, exp_key)
+    return None
+
+
+async def _renew_restart(exp_key, owner):
+    while True:
+        await asyncio.sleep(RESTART_HEARTBEAT_SECONDS)
+        if not await _offload(get_coordinator().acquire, f"restart:{exp_key}", owner, _lease_ttl()):
+            logger.error("Restart lease of %s was lost while restarting", exp_key)
+            return
+
+
+async def _leased(coro, exp_key, owner):
+    """Await a restart coroutine under exp_key's restart lease, renewing it, then release the lease.
+
+    A restart still running after RESTART_LEASE_SECONDS is cancelled, which
+    kills its processes and records it as failed.
+    """
+    heartbeat = asyncio.ensure_future(_renew_restart(exp_key, owner))
+    try:
+        return await asyncio.wait_for(coro, restart_lease_seconds())
+    except asyncio.TimeoutError:
+        logger.error("Restart of %s exceeded %ss and was stopped", exp_key, restart_lease_seconds())
+        return False
+    finally:
+        heartbeat.cancel()
+        await _offload(_release_restart, exp_key, owner)
+
+
+async def _await_other_restart(exp_key):
+    """Wait for a restart started elsewhere to finish; return True if it succeeded."""
+    while await _offload(get_coordinator().holder, f"restart:{exp_key}"):
+        await asyncio.sleep(1)
+    # The outcome is published just before the lease is released; give it time to arrive
+    for _ in range(10):
+        status = (await _offload(restart_state, exp_key)).get("status")
+        if status not in ("queued", "running", "abandoned"):
+            break
+        await asyncio.sleep(0.2)
+    return status == "succeeded"
+
+
+def _run_in_thread(coro):
+    """Run a restart coroutine on its own event loop in a background thread."""
+    def runner():
+        try:
+            asyncio.run(coro)
+        finally:
+            with _threads_lock:
+                _restart_threads.discard(thread)
+    thread = threading.Thread(target=runner, name='restart', daemon=True)
+    with _threads_lock:
+        _restart_threads.add(thread)
+    thread.start()
+
+
+def wait_for_restarts(timeout):
+    """Block until restarts running in this process's threads finish, for at most timeout seconds.
+
+    Called from the gunicorn worker_exit hook so recycling a worker doesn't
+    kill a restart halfway through (only relevant with RESTART_RUNNER = 'inline').
+    """
+    deadline = time.monotonic() + timeout
+    with _threads_lock:
+        threads = list(_restart_threads)
+    for thread in threads:
+        thread.join(max(deadline - time.monotonic(), 0))
+    return not any(t.is_alive() for t in threads)
+
+
+def _queue_restart(exp_key, owner):
+    """Hand a claimed restart to manage.py restart_worker."""
+    _mark(exp_key, status="queued", returncode=None, failed_step=None, steps=None)
+    get_coordinator().publish("restart-requests", {"exp": exp_key, "owner": owner})
+
+
+def _claim_new_restart(exp_key, before_start):
+    owner = _claim_restart(exp_key)
+    if owner is not None and before_start is not None:
+        try:
+            before_start()
+        except BaseException:
+            _release_restart(exp_key, owner)
+            raise
+    return owner
+
+
+def start_restart(exp_key, before_start=None):
+    """Restart exp_key's testbed in the background; return False if nothing is configured.
+
+    At most one restart per testbed runs across all workers; if one is
+    already in progress this returns True without starting another.
+    ``before_start()`` is called only when this call is about to start a new
+    restart; if it raises, no restart starts and the exception propagates.
+    The restart runs in manage.py restart_worker with RESTART_RUNNER =
+    'worker', else in a thread of this process.
+    """
+    job = _restart_job(exp_key)
+    if job is None:
+        return False
+    owner = _claim_new_restart(exp_key, before_start)
+    if owner is None:
+        return True
+    if restart_runner() == 'worker':
+        _queue_restart(exp_key, owner)
+    else:
+        _run_in_thread(_leased(job(), exp_key, owner))
+    return True
+
+
+def _restart_coro(exp_key):
+    job = _restart_job(exp_key)
+    if job is None:
+        return None
+    owner = _claim_restart(exp_key)
+    if owner is None:
+        return _await_other_restart(exp_key)
+    return _leased(job(), exp_key, owner)
+
+
+def has_restart(exp_key):
+    """True if exp_key has a restart plan or a runnable restart script."""
+    return get_plan(exp_key) is not None or resolve_script(exp_key) is not None
+
+
+async def arestart(exp_key):
+    """Restart exp_key's testbed and wait for it; return True/False, or None if nothing is configured."""
+    coro = await _offload(_restart_coro, exp_key)
+    if coro is None:
+        return None
+    return await coro
+
+
+async def schedule_restart(exp_key, before_start=None):
+    """Restart exp_key's testbed in the background from async code; return False if nothing is configured.
+
+    Like start_restart, but with RESTART_RUNNER = 'inline' the restart runs
+    as a task on the running event loop. The coordinator calls (and
+    before_start) run in a thread.
+    """
+    job = _restart_job(exp_key)
+    if job is None:
+        return False
+    owner = await _offload(_claim_new_restart, exp_key, before_start)
+    if owner is None:
+        return True
+    if restart_runner() == 'worker':
+        await _offload(_queue_restart, exp_key, owner)
+        return True
+    task = asyncio.get_running_loop().create_task(_leased(job(), exp_key, owner))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return True
+
+
+async def run_restart_worker(grace=None):
+    """Run the restarts web workers queue with RESTART_RUNNER = 'worker' until SIGTERM or SIGINT.
+
+    Every restart worker hears each request, and one of them wins it. On
+    shutdown, running restarts get grace seconds (default
+    RESTART_LEASE_SECONDS) to finish before they are cancelled, which kills
+    their processes and records them as failed.
+    """
+    loop = asyncio.get_running_loop()
+    stopping = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+    worker_id = new_owner()
+    tasks = set()
+
+    async def run(message):
+        exp_key, owner = message["exp"], message["owner"]
+        acquire = get_coordinator().acquire
+        if not await _offload(acquire, f"restart-job:{owner}", worker_id, restart_lease_seconds()):
+            return  # another restart worker took it
+        # Renew at once: the web worker's claim only lasts a few heartbeats
+        if not await _offload(acquire, f"restart:{exp_key}", owner, _lease_ttl()):
+            logger.error("Restart request for %s arrived after its lease lapsed, dropping it", exp_key)
+            return
+        job = _restart_job(exp_key)
+        if job is None:
+            await _offload(_release_restart, exp_key, owner)
+            return
+        await _leased(job(), exp_key, owner)
+
+    def accept(message):
+        if stopping.is_set():
+            return
+        task = loop.create_task(run(message))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    # Called on the coordinator's listener thread
+    get_coordinator().subscribe("restart-requests", lambda message: loop.call_soon_threadsafe(accept, message))
+    logger.info("Restart worker %s waiting for requests", worker_id)
+    await stopping.wait()
+
+    pending = set(tasks)
+    if pending:
+        logger.info("Waiting for %d running restarts to finish", len(pending))
+        _, pending = await asyncio.wait(pending, timeout=restart_lease_seconds() if grace is None else grace)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+
+def probe_service(url, timeout=PROBE_TIMEOUT):
+    """Return True if the testbed UI at url answers an HTTP request."""
+    try:
+        with urllib.request.urlopen(url, timeout=timeout):
+            return True
+    except urllib.error.HTTPError:
+        return True  # the server answered, even if with an error page
+    except Exception:
+        return False
+
+
+async def aprobe_service(url, timeout=PROBE_TIMEOUT):
+    """Async version of probe_service using a raw HTTP/1.0 HEAD request."""
+    parsed = urllib.parse.urlsplit(url)
+    host = parsed.hostname
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=parsed.scheme == "https"), timeout
+        )
+        writer.write(f"HEAD {parsed.path or '/'} HTTP/1.0\r\nHost: {host}\r\n\r\n".encode())
+        await writer.drain()
+        line = await asyncio.wait_for(reader.readline(), timeout)
+        return line.startswith(b"HTTP/")
+    except Exception:
+        return False
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def probe_services():
+    """Return {exp_key: reachable} for every testbed, reusing results younger than SERVICE_PROBE_CACHE_SECONDS."""
+    reachable = cache.get(PROBE_CACHE_KEY)
+    if reachable is None:
+        keys = list(SERVICE_MAP)
+        reachable = dict(zip(keys, _probe_pool.map(probe_service, [SERVICE_MAP[k]["url"] for k in keys])))
+        if settings.SERVICE_PROBE_CACHE_SECONDS:
+            cache.set(PROBE_CACHE_KEY, reachable, settings.SERVICE_PROBE_CACHE_SECONDS)
+    return reachable
+
+
+async def aprobe_services():
+    """Async version of probe_services."""
+    reachable = await cache.aget(PROBE_CACHE_KEY)
+    if reachable is None:
+        keys = list(SERVICE_MAP)
+        reachable = dict(zip(keys, await asyncio.gather(*(aprobe_service(SERVICE_MAP[k]["url"]) for k in keys))))
+        if settings.SERVICE_PROBE_CACHE_SECONDS:
+            await cache.aset(PROBE_CACHE_KEY, reachable, settings.SERVICE_PROBE_CACHE_SECONDS)
+    return reachable
+
+
+def service_status_payload(exp_key, reachable, detail=False):
+    """Build the JSON body entry reported by the status endpoints (blocking: reads the coordinator).
+
+    Without detail the restart state is reduced to its status; step timings,
+    return codes and the failed step are for staff.
+    """
+    entry = SERVICE_MAP[exp_key]
+    restart = restart_state(exp_key) or None
+    if restart and not detail:
+        restart = {"status": restart["status"]}
+    return {
+        "url": entry["url"],
+        "reachable": reachable,
+        "restart": restart,
+    }
@@ -1,5 +1,9 @@
 from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save
 from django.dispatch import receiver
+from .images import normalize_upload, warm_variants
+from .models import User
 import logging
 
 logger = logging.getLogger(__name__)
@@ -9,3 +13,25 @@ def on_user_logged_in(sender, user, request, **kwargs):
     # Disabled to prevent running side-effects on every login.
     logger.info("on_user_logged_in called for %s but handler is disabled.", getattr(user, "username", user))
     return
+
+
+@receiver(pre_save, sender=User)
+def normalize_profile_pic(sender, instance, **kwargs):
+    """Re-encode a newly uploaded profile picture before it is stored."""
+    pic = instance.profile_pic
+    if not pic or getattr(pic, '_committed', True):
+        return
+    content = normalize_upload(pic.file)
+    name = pic.field.generate_filename(instance, content.name)
+    if pic.storage.exists(name):
+        # Same picture already stored (content-hash name); reuse it and its variants
+        instance.profile_pic = name
+    else:
+        pic.save(content.name, content, save=False)
+
+
+@receiver(post_save, sender=User)
+def warm_profile_pic_variants(sender, instance, **kwargs):
+    """Render avatar thumbnails in the background once the save is committed."""
+    if instance.profile_pic:
+        transaction.on_commit(lambda: warm_variants(instance.profile_pic))
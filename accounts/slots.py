@@ -0,0 +1,176 @@
+import heapq
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import SessionBooking
+
+# Slot grid used by the booking dashboard
+SLOT_STEP = timedelta(minutes=30)
+MAX_SLOTS = 20
+
+
+def slot_window_start(date_str):
+    """Return the first candidate slot start for a YYYY-MM-DD date (or now)."""
+    if date_str:
+        try:
+            target_date = timezone.datetime.strptime(date_str, '%Y-%m-%d').date()
+            # Start from beginning of target date or now, whichever is later
+            start_of_day = timezone.make_aware(timezone.datetime.combine(target_date, timezone.datetime.min.time()))
+            current = max(start_of_day, timezone.now())
+        except ValueError:
+            current = timezone.now()
+    else:
+        current = timezone.now()
+
+    # Round up to nearest 5 minutes for cleaner slots (on the minute, so slots line up with holds)
+    current = current + timedelta(minutes=5 - (current.minute % 5))
+    return current.replace(second=0, microsecond=0)
+
+
+def slot_window_end(current, duration):
+    """Return the end of the last candidate slot starting at current."""
+    return current + SLOT_STEP * (MAX_SLOTS - 1) + timedelta(minutes=duration)
+
+
+def overlapping_bookings(experiment, current, duration):
+    """Queryset of (start_time, end_time, user_id) rows that touch the slot window."""
+    return experiment.bookings.filter(
+        status='active',
+        start_time__lt=slot_window_end(current, duration),
+        end_time__gt=current,
+    ).values_list('start_time', 'end_time', 'user_id')
+
+
+def build_slots(current, duration, bookings, user_id):
+    """Label each candidate slot as available, booked or my_booking.
+
+    ``bookings`` is an iterable of (start_time, end_time, user_id) tuples for
+    the experiment, so the whole grid is computed from a single query.
+    """
+    bookings = list(bookings)
+    slots = []
+    for _ in range(MAX_SLOTS):
+        slot_end = current + timedelta(minutes=duration)
+        overlapping = [b for b in bookings if b[0] < slot_end and b[1] > current]
+
+        if any(b[2] == user_id for b in overlapping):
+            status = 'my_booking'
+        elif overlapping:
+            status = 'booked'
+        else:
+            status = 'available'
+
+        slots.append({
+            'start': current.isoformat(),
+            'end': slot_end.isoformat(),
+            'display': timezone.localtime(current).strftime('%H:%M'),
+            'status': status,
+        })
+
+        # Move to next slot
+        current = current + SLOT_STEP
+    return slots
+
+
+class GapIndex:
+    """Free intervals of one experiment, indexed for earliest-fit queries.
+
+    Gaps are kept in start order next to a max segment tree over their
+    lengths, so finding the first gap that can hold a duration is
+    O(log n) in the number of bookings rather than a scan over slots.
+    """
+
+    def __init__(self, gaps):
+        self.gaps = gaps
+        size = 1
+        while size < len(gaps):
+            size *= 2
+        self._size = size
+        self._tree = [0.0] * (2 * size)
+        for i, (start, end) in enumerate(gaps):
+            self._tree[size + i] = (end - start).total_seconds()
+        for i in range(size - 1, 0, -1):
+            self._tree[i] = max(self._tree[2 * i], self._tree[2 * i + 1])
+
+    @classmethod
+    def from_bookings(cls, bookings, window_start, window_end):
+        """Build from (start_time, end_time) pairs sorted by start_time."""
+        gaps = []
+        cursor = window_start
+        for start, end in bookings:
+            if start > cursor:
+                gaps.append((cursor, min(start, window_end)))
+            cursor = max(cursor, end)
+            if cursor >= window_end:
+                break
+        if cursor < window_end:
+            gaps.append((cursor, window_end))
+        return cls(gaps)
+
+    def _first_at_least(self, lo, seconds, node=1, node_lo=0, node_hi=None):
+        """Index of the first gap at position >= lo that is at least seconds long."""
+        if node_hi is None:
+            node_hi = self._size
+        if node_hi <= lo or self._tree[node] < seconds:
+            return None
+        if node_hi - node_lo == 1:
+            return node_lo
+        mid = (node_lo + node_hi) // 2
+        found = self._first_at_least(lo, seconds, 2 * node, node_lo, mid)
+        if found is None:
+            found = self._first_at_least(lo, seconds, 2 * node + 1, mid, node_hi)
+        return found
+
+    def fits(self, duration):
+        """Yield (start, free_until) for each gap that can hold duration, earliest first."""
+        seconds = duration.total_seconds()
+        i = 0
+        while True:
+            i = self._first_at_least(i, seconds)
+            if i is None or i >= len(self.gaps):
+                return
+            yield self.gaps[i]
+            i += 1
+
+
+def build_gap_indexes(experiments, window_start, window_end, held=None):
+    """Return {exp_key: GapIndex} for experiments using a single bookings query.
+
+    ``held`` optionally maps exp_key to sorted (start, end) intervals that
+    also count as busy, e.g. from ``holds.held_intervals``.
+    """
+    by_exp = {exp.exp_key: [] for exp in experiments}
+    rows = SessionBooking.objects.filter(
+        experiment__in=experiments,
+        status='active',
+        start_time__lt=window_end,
+        end_time__gt=window_start,
+    ).order_by('start_time').values_list('experiment__exp_key', 'start_time', 'end_time')
+    for exp_key, start, end in rows:
+        by_exp[exp_key].append((start, end))
+    for exp_key, spans in (held or {}).items():
+        if spans and exp_key in by_exp:
+            by_exp[exp_key] = list(heapq.merge(by_exp[exp_key], spans))
+    return {key: GapIndex.from_bookings(b, window_start, window_end) for key, b in by_exp.items()}
+
+
+def earliest_fits(indexes, duration, k):
+    """Return the k earliest free intervals of length duration across all indexes."""
+    def stream(exp_key, index):
+        for start, free_until in index.fits(duration):
+            yield start, exp_key, free_until
+
+    streams = [stream(exp_key, index) for exp_key, index in indexes.items()]
+    results = []
+    for start, exp_key, free_until in heapq.merge(*streams):
+        results.append({
+            'exp': exp_key,
+            'start': start.isoformat(),
+            'end': (start + duration).isoformat(),
+            'free_until': free_until.isoformat(),
+            'display': timezone.localtime(start).strftime('%Y-%m-%d %H:%M'),
+        })
+        if len(results) >= k:
+            break
+    return results
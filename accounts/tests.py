@@ -1,3 +1,446 @@
-from django.test import TestCase
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from . import audit, coordination, ratelimit
+from .holds import holders, place_hold
+from .notifications import dispatch, enqueue, queue_reminders
+from .orchestrator import PlanError, Step, first_failure, plan_succeeded, run_plan, validate_plan
+from .restart_plans import oai_plan, stand_in_plan
+from .ratelimit import LocalBuckets, parse_rate
+from .models import Experiment, Notification, SessionBooking, User, WaitlistEntry
+from .slots import GapIndex, earliest_fits
+from .waitlist import cancel_and_reassign, release_interval
+
+T0 = datetime(2026, 1, 5, 8, 0, tzinfo=dt_timezone.utc)
+
+
+def _at(minute):
+    return T0 + timedelta(minutes=minute)
+
+
+def _free_runs(bookings, window):
+    """Brute-force maximal free (start, end) minute runs in [0, window)."""
+    busy = [False] * window
+    for start, end in bookings:
+        for m in range(max(start, 0), min(end, window)):
+            busy[m] = True
+    runs, start = [], None
+    for m in range(window + 1):
+        if m < window and not busy[m]:
+            start = m if start is None else start
+        elif start is not None:
+            runs.append((start, m))
+            start = None
+    return runs
+
+
+class GapIndexTests(SimpleTestCase):
+    def test_fits_matches_brute_force(self):
+        rng = random.Random(28)
+        for _ in range(300):
+            window = rng.randint(60, 720)
+            bookings = []
+            for _ in range(rng.randint(0, 25)):
+                start = rng.randint(-60, window + 30)
+                bookings.append((start, start + rng.randint(1, 180)))
+            bookings.sort()
+            index = GapIndex.from_bookings(
+                [(_at(s), _at(e)) for s, e in bookings], _at(0), _at(window)
+            )
+            runs = _free_runs(bookings, window)
+            for duration in (1, 15, 30, 60, 240):
+                expected = [(_at(s), _at(e)) for s, e in runs if e - s >= duration]
+                self.assertEqual(list(index.fits(timedelta(minutes=duration))), expected, (bookings, window, duration))
+
+    def test_empty_and_fully_booked_windows(self):
+        self.assertEqual(
+            list(GapIndex.from_bookings([], _at(0), _at(60)).fits(timedelta(minutes=60))), [(_at(0), _at(60))]
+        )
+        full = GapIndex.from_bookings([(_at(-10), _at(30)), (_at(30), _at(70))], _at(0), _at(60))
+        self.assertEqual(list(full.fits(timedelta(minutes=1))), [])
+
+    def test_earliest_fits_merges_experiments_in_start_order(self):
+        rng = random.Random(280)
+        indexes, expected = {}, []
+        for key in ('exp1', 'exp2', 'exp3'):
+            bookings = sorted((s, s + rng.randint(10, 90)) for s in rng.sample(range(0, 600, 10), 12))
+            indexes[key] = GapIndex.from_bookings([(_at(s), _at(e)) for s, e in bookings], _at(0), _at(600))
+            expected += [(s, key) for s, e in _free_runs(bookings, 600) if e - s >= 30]
+        expected.sort()
+        results = earliest_fits(indexes, timedelta(minutes=30), 5)
+        self.assertEqual([(r['start'], r['exp']) for r in results], [(_at(s).isoformat(), k) for s, k in expected[:5]])
+        for r in results:
+            self.assertEqual(datetime.fromisoformat(r['end']) - datetime.fromisoformat(r['start']), timedelta(minutes=30))
+
+
+class LabTestCase(TestCase):
+    """Fresh in-process coordinator, rate limits and audit buffer, one experiment and a tomorrow-morning anchor per test."""
+
+    def setUp(self):
+        events = audit.AuditBuffer()
+        events._pid = os.getpid()  # no writer thread: flushed inside the test's transaction below
+        for patcher in (
+            mock.patch.object(coordination, '_coordinator', coordination.RedisCoordinator(coordination.LocalRedis())),
+            mock.patch.object(ratelimit, '_local', ratelimit.LocalBuckets()),
+            mock.patch.object(audit, '_buffer', events),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(events.flush)
+        self.exp = Experiment.objects.create(exp_key='exp1', name='OAI', description='', url='http://127.0.0.1')
+        self.start = (timezone.now() + timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0)
+
+    def user(self, name):
+        return User.objects.create_user(name, f'{name}@example.com')
+
+    def at(self, minutes):
+        return self.start + timedelta(minutes=minutes)
+
+    def book(self, user, start, end, **kwargs):
+        return SessionBooking.objects.create(
+            user=user, experiment=self.exp, start_time=self.at(start), end_time=self.at(end), **kwargs
+        )
+
+    def wait(self, user, start, end, duration):
+        return WaitlistEntry.objects.create(
+            user=user, experiment=self.exp, window_start=self.at(start), window_end=self.at(end), duration=duration
+        )
+
+
+class WaitlistTests(LabTestCase):
+    def test_longest_fitting_request_wins_and_leftover_goes_to_the_next(self):
+        short = self.wait(self.user('short'), 0, 240, 30)
+        first = self.wait(self.user('first'), 0, 240, 60)
+        second = self.wait(self.user('second'), 0, 240, 60)
+        too_long = self.wait(self.user('long'), 0, 240, 120)
+
+        assigned = release_interval(self.exp, self.at(0), self.at(90))
+
+        self.assertEqual({e.id for e in assigned}, {first.id, short.id})
+        first.refresh_from_db()
+        short.refresh_from_db()
+        self.assertEqual((first.booking.start_time, first.booking.end_time), (self.at(0), self.at(60)))
+        self.assertEqual((short.booking.start_time, short.booking.end_time), (self.at(60), self.at(90)))
+        self.assertEqual(
+            set(WaitlistEntry.objects.filter(status='waiting').values_list('id', flat=True)), {second.id, too_long.id}
+        )
+        self.assertEqual(Notification.objects.filter(kind='waitlist_assigned').count(), 2)
+
+    def test_slot_starts_inside_the_waiters_window(self):
+        entry = self.wait(self.user('late'), 30, 120, 60)
+        release_interval(self.exp, self.at(0), self.at(120))
+        entry.refresh_from_db()
+        self.assertEqual((entry.booking.start_time, entry.booking.end_time), (self.at(30), self.at(90)))
+
+    def test_busy_and_held_time_is_not_assigned(self):
+        self.book(self.user('owner'), 30, 60)
+        holder = self.user('holder')
+        self.assertTrue(place_hold(holder.pk, 'exp1', self.at(60), self.at(90)))
+        waiter = self.user('waiter')
+        self.wait(waiter, 0, 120, 30)
+        self.wait(waiter, 0, 120, 30)
+        self.wait(waiter, 0, 120, 30)
+
+        assigned = release_interval(self.exp, self.at(0), self.at(120))
+
+        self.assertEqual(sorted(e.booking.start_time for e in assigned), [self.at(0), self.at(90)])
+
+    def test_cancel_is_idempotent(self):
+        owner = self.user('owner')
+        booking = self.book(owner, 0, 60)
+        stale = SessionBooking.objects.get(pk=booking.pk)
+        entry = self.wait(self.user('waiter'), 0, 120, 60)
+
+        self.assertEqual([e.id for e in cancel_and_reassign(booking)], [entry.id])
+        self.assertIsNone(cancel_and_reassign(booking))
+        self.assertIsNone(cancel_and_reassign(stale))
+
+        self.assertEqual(SessionBooking.objects.filter(status='active').count(), 1)
+        self.assertEqual(Notification.objects.filter(kind='cancelled', user=owner).count(), 1)
+
+
+class HoldTests(LabTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = self.user('alice')
+        self.bob = self.user('bob')
+
+    def post_as(self, user, name, start, duration=60):
+        self.client.force_login(user)
+        return self.client.post(
+            f'/accounts/{name}/', {'exp': 'exp1', 'start_time': self.at(start).isoformat(), 'duration': duration}
+        )
+
+    def test_hold_keeps_others_out_until_its_owner_books(self):
+        response = self.post_as(self.alice, 'hold-slot', 0)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['hold'])
+
+        self.assertEqual(self.post_as(self.bob, 'hold-slot', 30).status_code, 409)
+        self.assertEqual(self.post_as(self.bob, 'book-session', 30).status_code, 400)
+        self.assertFalse(SessionBooking.objects.exists())
+
+        self.assertEqual(self.post_as(self.alice, 'book-session', 0).status_code, 302)
+        self.assertTrue(SessionBooking.objects.filter(user=self.alice, start_time=self.at(0)).exists())
+        self.assertEqual(holders('exp1', self.at(0), self.at(60)), {})
+
+    def test_booked_time_cannot_be_held(self):
+        self.book(self.bob, 30, 90)
+        self.assertEqual(self.post_as(self.alice, 'hold-slot', 0).status_code, 409)
+        self.assertEqual(holders('exp1', self.at(0), self.at(60)), {})
+
+    def test_hold_does_not_override_a_booking_made_since(self):
+        self.assertTrue(place_hold(self.alice.pk, 'exp1', self.at(0), self.at(60)))
+        # e.g. a waitlist assignment, which doesn't look at holds
+        self.book(self.bob, 30, 90)
+        self.assertEqual(self.post_as(self.alice, 'book-session', 0).status_code, 400)
+        self.assertEqual(SessionBooking.objects.count(), 1)
+
+    def test_next_slots_skip_held_time(self):
+        self.book(self.bob, 60, 90)
+        self.assertTrue(place_hold(self.bob.pk, 'exp1', self.at(0), self.at(30)))
+        self.client.force_login(self.alice)
+        response = self.client.get('/accounts/api/next-slots/', {
+            'exp': 'exp1', 'duration': 30, 'k': 2, 'from': self.at(0).isoformat(), 'to': self.at(180).isoformat(),
+        })
+        self.assertEqual(
+            [s['start'] for s in response.json()['slots']], [self.at(30).isoformat(), self.at(90).isoformat()]
+        )
+
+
+class LocalBucketTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('accounts.ratelimit.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.buckets = LocalBuckets()
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('6/m'), (0.1, 6))
+        self.assertEqual(parse_rate('100/s'), (100.0, 100))
+        rate, burst = parse_rate('2/5m')
+        self.assertAlmostEqual(rate, 2 / 300)
+        self.assertEqual(burst, 2)
+
+    def test_burst_then_refill(self):
+        spec = [('restart:user:1', 0.5, 3)]
+        self.assertEqual([self.buckets.take(spec) for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(self.buckets.take(spec), 2.0)
+        self.now += 1.0
+        self.assertAlmostEqual(self.buckets.take(spec), 1.0)
+        self.now += 1.0
+        self.assertEqual(self.buckets.take(spec), 0.0)
+        # Refills to the burst size and no further
+        self.now += 3600
+        self.assertEqual([self.buckets.take(spec) for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertGreater(self.buckets.take(spec), 0)
+
+    def test_rejection_takes_nothing(self):
+        user = ('booking:user:1', 1.0, 1)
+        shared = ('booking:all:', 1.0, 5)
+        self.assertEqual(self.buckets.take([user, shared]), 0.0)
+        before = dict(self.buckets._buckets)
+        self.assertAlmostEqual(self.buckets.take([user, shared]), 1.0)
+        self.assertEqual(self.buckets._buckets, before)
+        # A rejected request for a new key doesn't add a bucket either
+        self.assertGreater(self.buckets.take([('booking:exp:x', 1.0, 1), user]), 0)
+        self.assertNotIn('booking:exp:x', self.buckets._buckets)
+        # The shared bucket only lost the one token taken while both had room
+        self.assertEqual([self.buckets.take([(f'booking:user:{i}', 1.0, 1), shared]) for i in range(2, 6)], [0.0] * 4)
+        self.assertGreater(self.buckets.take([('booking:user:6', 1.0, 1), shared]), 0)
+
+    def test_refilled_buckets_are_pruned(self):
+        with mock.patch('accounts.ratelimit.MAX_LOCAL_BUCKETS', 10):
+            buckets = LocalBuckets()
+            for i in range(10):
+                buckets.take([(f'k{i}', 1.0, 1)])
+            self.now += 5
+            buckets.take([('live', 0.001, 1)])
+            self.assertEqual(list(buckets._buckets), ['live'])
+
+
+class RunPlanTests(SimpleTestCase):
+    def plan(self):
+        return stand_in_plan(oai_plan('10.0.0.1', gnb=True, ues=('ue1', 'ue2')), 0.02)
+
+    def run_steps(self, steps):
+        updates = []
+        results = asyncio.run(run_plan(steps, on_update=lambda r: updates.append({k: v['status'] for k, v in r.items()})))
+        return results, updates
+
+    def test_steps_start_once_prerequisites_are_ready(self):
+        results, updates = self.run_steps(self.plan())
+        self.assertTrue(plan_succeeded(results))
+        self.assertEqual(first_failure(results), (None, None))
+        self.assertLessEqual(results['core_up']['ready_at'], results['gnb_up']['started'])
+        for ue in ('ue1_up', 'ue2_up'):
+            self.assertLessEqual(results['gnb_up']['ready_at'], results[ue]['started'])
+        # Both UEs run at the same time
+        self.assertLess(results['ue2_up']['started'], results['ue1_up']['finished'])
+        self.assertEqual(updates[0]['core_down'], 'running')
+
+    def test_failed_step_skips_its_dependents(self):
+        steps = self.plan()
+        steps[1].command = ['false']
+        results, _ = self.run_steps(steps)
+        self.assertFalse(plan_succeeded(results))
+        self.assertEqual(results['core_up']['status'], 'failed')
+        self.assertEqual(results['core_up']['returncode'], 1)
+        self.assertEqual(results['gnb_up'], {'status': 'skipped', 'reason': 'prerequisite failed: core_up'})
+        self.assertEqual({results[ue]['status'] for ue in ('ue1_up', 'ue2_up')}, {'skipped'})
+        self.assertEqual(first_failure(results)[0], 'core_up')
+
+    def test_overrunning_command_is_killed(self):
+        steps = [Step('hang', ['sleep', '30'], timeout=0.2), Step('after', ['true'], requires=['hang'])]
+        started = time.monotonic()
+        results, _ = self.run_steps(steps)
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(results['hang']['status'], 'failed')
+        self.assertIsNone(results['hang']['returncode'])
+        self.assertEqual(results['hang']['reason'], 'command timed out after 0.2s')
+        self.assertEqual(results['after']['status'], 'skipped')
+
+    def test_readiness_timeouts(self):
+        steps = [
+            Step('never_ready', ['true'], ready=['false'], ready_timeout=0.2, poll_interval=0.05),
+            Step('hung_probe', ['true'], ready=['sleep', '30'], ready_timeout=0.2),
+        ]
+        started = time.monotonic()
+        results, _ = self.run_steps(steps)
+        self.assertLess(time.monotonic() - started, 5)
+        for name in ('never_ready', 'hung_probe'):
+            self.assertEqual(results[name]['status'], 'failed')
+            self.assertEqual(results[name]['reason'], 'readiness check timed out')
+
+    def test_invalid_plans(self):
+        with self.assertRaises(PlanError):
+            validate_plan([Step('a', ['true'], requires=['b']), Step('b', ['true'], requires=['a'])])
+        with self.assertRaises(PlanError):
+            validate_plan([Step('a', ['true'], requires=['missing'])])
+        with self.assertRaises(PlanError):
+            validate_plan([Step('a', ['true']), Step('a', ['true'])])
+
+
+class CoordinatorContract:
+    """Lease, lock and token-bucket behaviour every coordination backend must share."""
+
+    def make(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.coordinator = self.make()
+
+    def test_lease_acquire_renew_release(self):
+        c = self.coordinator
+        self.assertTrue(c.acquire('restart:exp1', 'a', 30))
+        self.assertFalse(c.acquire('restart:exp1', 'b', 30))
+        self.assertTrue(c.acquire('restart:exp1', 'a', 30))  # renewal
+        c.release('restart:exp1', 'b')  # not b's to release
+        self.assertEqual(c.holder('restart:exp1'), 'a')
+        c.release('restart:exp1', 'a')
+        self.assertIsNone(c.holder('restart:exp1'))
+        self.assertTrue(c.acquire('restart:exp1', 'b', 30))
+
+    def test_lease_expiry(self):
+        c = self.coordinator
+        self.assertTrue(c.acquire('short', 'a', 0.05))
+        self.assertTrue(c.acquire('long', 'a', 30))
+        self.assertEqual(c.holders(['short', 'long', 'missing']), {'short': 'a', 'long': 'a'})
+        time.sleep(0.1)
+        self.assertEqual(c.holders(['short', 'long']), {'long': 'a'})
+        self.assertTrue(c.acquire('short', 'b', 30))
+        self.assertEqual(c.holders([]), {})
+
+    def test_lock_excludes_other_holders(self):
+        c = self.coordinator
+        with c.lock('booking:exp1'):
+            with self.assertRaises(coordination.LockTimeout):
+                with c.lock('booking:exp1', timeout=0.05):
+                    pass
+        with c.lock('booking:exp1', timeout=0.05):
+            pass
+
+    def test_take_tokens(self):
+        c = self.coordinator
+        user, shared = ('restart:user:1', 1.0, 2), ('restart:all:', 0.1, 10)
+        self.assertEqual([c.take_tokens([user, shared]) for _ in range(2)], [0.0, 0.0])
+        self.assertGreater(c.take_tokens([user, shared]), 0)
+        # The rejected call left the shared bucket alone: 8 tokens remain
+        self.assertEqual([c.take_tokens([(f'restart:user:{i}', 1.0, 1), shared]) for i in range(2, 10)], [0.0] * 8)
+        self.assertAlmostEqual(c.take_tokens([('restart:user:10', 1.0, 1), shared]), 10.0, delta=0.5)
+
+
+class FileCoordinatorTests(CoordinatorContract, SimpleTestCase):
+    def make(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return coordination.FileCoordinator(directory.name)
+
+
+class LocalRedisCoordinatorTests(CoordinatorContract, SimpleTestCase):
+    def make(self):
+        return coordination.RedisCoordinator(coordination.LocalRedis())
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class DispatchTests(LabTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = self.user('alice')
+        self.bob = self.user('bob')
+
+    def test_reminders_are_queued_once_for_bookings_about_to_start(self):
+        soon = self.book(self.alice, 0, 60)
+        self.book(self.bob, 60, 120)
+        self.book(self.bob, 10, 20, status='cancelled')
+        self.assertEqual(queue_reminders(now=self.at(-20)), 1)
+        queue_reminders(now=self.at(-20))
+        self.assertEqual(list(Notification.objects.values_list('booking_id', 'kind')), [(soon.id, 'reminder')])
+
+    def test_sends_due_mail_and_skips_reminders_for_cancelled_bookings(self):
+        active = self.book(self.alice, 0, 60)
+        cancelled = self.book(self.bob, 60, 120, status='cancelled')
+        enqueue('reminder', active)
+        enqueue('reminder', cancelled)
+        enqueue('cancelled', cancelled)
+
+        self.assertEqual(dispatch(), {'sent': 2, 'failed': 0, 'skipped': 1})
+        self.assertEqual(
+            sorted((m.to[0], m.subject.split(':')[0]) for m in mail.outbox),
+            [('alice@example.com', 'Reminder'), ('bob@example.com', 'Booking cancelled')],
+        )
+        self.assertEqual(Notification.objects.get(booking=cancelled, kind='reminder').status, 'skipped')
+        self.assertEqual(dispatch(), {'sent': 0, 'failed': 0, 'skipped': 0})
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_refused_message_is_retried_later_without_blocking_the_batch(self):
+        enqueue('reminder', self.book(self.alice, 0, 60))
+        refused = self.book(self.bob, 60, 120)
+        enqueue('reminder', refused)
+        send = EmailBackend.send_messages
+
+        def refuse_bob(backend, messages):
+            if messages[0].to == ['bob@example.com']:
+                raise OSError('550 mailbox unavailable')
+            return send(backend, messages)
+
+        now = timezone.now()
+        with mock.patch.object(EmailBackend, 'send_messages', refuse_bob):
+            self.assertEqual(dispatch(now=now), {'sent': 1, 'failed': 1, 'skipped': 0})
+        retry = Notification.objects.get(booking=refused)
+        self.assertEqual((retry.status, retry.attempts, retry.last_error), ('pending', 1, '550 mailbox unavailable'))
+        self.assertEqual(retry.next_attempt_at, now + timedelta(minutes=1))
+        self.assertEqual(dispatch(now=now)['sent'], 0)
+        self.assertEqual(dispatch(now=now + timedelta(minutes=1))['sent'], 1)
+        self.assertEqual([m.to for m in mail.outbox], [['alice@example.com'], ['bob@example.com']])
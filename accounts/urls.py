@@ -1,17 +1,33 @@
-from django.urls import path
+from django.conf import settings
+from django.urls import path, re_path
 from . import views
 
+# Serve the slow-I/O endpoints natively async when running under ASGI
+if getattr(settings, 'ASYNC_VIEWS', False):
+    from . import async_views as io_views
+else:
+    io_views = views
+
 app_name = 'accounts'
 
 urlpatterns = [
     path('home/', views.home, name='home'),
     path('booking/', views.booking_dashboard, name='booking_dashboard'),
     path('book-session/', views.book_session, name='book_session'),
-    path('start-experiment/<int:booking_id>/', views.start_experiment, name='start_experiment'),
+    path('hold-slot/', views.hold_slot, name='hold_slot'),
+    path('start-experiment/<int:booking_id>/', io_views.start_experiment, name='start_experiment'),
     path('cancel-booking/<int:booking_id>/', views.cancel_booking, name='cancel_booking'),
-    path('api/available-slots/', views.get_available_slots, name='available_slots'),
-    path('trigger-service/', views.trigger_service, name='trigger_service'),
+    path('waitlist/join/', views.join_waitlist, name='join_waitlist'),
+    path('waitlist/<int:entry_id>/leave/', views.leave_waitlist, name='leave_waitlist'),
+    path('api/available-slots/', io_views.get_available_slots, name='available_slots'),
+    path('api/next-slots/', views.find_next_slots, name='next_slots'),
+    path('api/health/', io_views.health, name='health'),
+    path('api/ready/', views.readiness, name='readiness'),
+    path('api/status/', io_views.service_status, name='service_status'),
+    path('api/audit/', views.audit_events, name='audit_events'),
+    path('trigger-service/', io_views.trigger_service, name='trigger_service'),
     path('profile/', views.profile_view, name='profile'),
+    re_path(r'^avatar/(?P<digest>[0-9a-f]{16})/(?P<size>[0-9]+)\.(?P<ext>webp|jpg)$', views.avatar, name='avatar'),
     path('add-experiment/', views.add_experiment, name='add_experiment'),
 ]
 
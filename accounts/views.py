@@ -4,42 +4,32 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
 from django.views.decorators.http import require_POST, require_GET
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.http import JsonResponse, HttpResponse, HttpResponseBadRequest, FileResponse, Http404
 from django.utils import timezone
-from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
 from datetime import timedelta
-from .models import Experiment, SessionBooking
+from .models import Experiment, SessionBooking, WaitlistEntry, AuditEvent, User
 from .forms import SignUpForm, ExperimentForm
+from .services import SERVICE_MAP as _SERVICE_MAP, start_restart, probe_services, service_status_payload
+from .db import run_write
+from . import audit
+from .coordination import get_coordinator, LockTimeout
+from .waitlist import cancel_and_reassign, max_window
+from .ratelimit import RateLimited, enforce, rate_limit
+from .images import AVATAR_SIZES, AVATAR_FORMATS, RENDER_ERRORS, ensure_variant, variant_path, source_path as image_source_path
+from .holds import place_hold, release_hold, owns_hold, held_by_others, held_intervals, mark_held_slots, hold_seconds
+from .slots import slot_window_start, overlapping_bookings, build_slots, build_gap_indexes, earliest_fits
+from functools import partial
 import logging
 import os
-import threading
-import subprocess
 
 logger = logging.getLogger(__name__)
 
-# Map experiment keys to their target UI URL and local restart script (relative to BASE_DIR)
-_SERVICE_MAP = {
-    "exp1": {"url": "http://10.7.43.10", "script": "scripts/restart_oai_core.sh"},
-    "exp2": {"url": "http://10.7.43.11", "script": "scripts/restart_gnb.sh"},
-    "exp3": {"url": "http://10.7.43.12", "script": "scripts/restart_ue.sh"},
-    "exp4": {"url": "http://10.7.43.13", "script": "scripts/restart_open5gs.sh"},
-    "exp5": {"url": "http://10.7.43.14", "script": "scripts/restart_free5gc.sh"},
-}
-
-def _run_script_async(script_path):
-    """Run restart script in background thread."""
-    def runner():
-        try:
-            subprocess.run(['bash', script_path], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            logger.info("Restart script succeeded: %s", script_path)
-        except Exception:
-            logger.exception("Restart script failed: %s", script_path)
-    t = threading.Thread(target=runner, daemon=True)
-    t.start()
-
 # ✅ Publicly accessible Intro Page (default landing)
 def intro_view(request): 
-    print("Intro page accessed.")
+    logger.debug("Intro page accessed.")
     return render(request, 'intro.html')
     
 # ✅ Home Page - Requires login
@@ -150,11 +140,16 @@ def booking_dashboard(request):
         start_time__gte=now
     ).order_by('start_time')
     
+    user_waitlist = request.user.waitlist_entries.filter(
+        status='waiting'
+    ).select_related('experiment')
+    
     # Build context with experiments and their availability
     context = {
         'experiments': experiments,
         'target_date': target_date,
         'user_bookings': user_bookings,
+        'user_waitlist': user_waitlist,
     }
     
     return render(request, 'booking_dashboard.html', context)
@@ -169,14 +164,21 @@ def start_experiment(request, booking_id):
     if not (booking.start_time <= now < booking.end_time) or booking.status != 'active':
         return HttpResponseBadRequest("Booking is not currently active.")
     
-    # Trigger restart script asynchronously
     exp = booking.experiment
-    script_rel = _SERVICE_MAP.get(exp.exp_key, {}).get('script')
-    if script_rel:
-        script_path = os.path.join(settings.BASE_DIR, script_rel)
-        if os.path.exists(script_path) and os.access(script_path, os.X_OK):
-            _run_script_async(script_path)
-            logger.info("Restart triggered for booking %s (user: %s)", booking_id, request.user.username)
+    if booking.is_warm:
+        # Pre-warm scheduler already readied the testbed for this slot
+        logger.info("Booking %s starts on a pre-warmed testbed (user: %s)", booking_id, request.user.username)
+        return redirect(exp.full_url)
+    
+    # Only a restart that really starts (not one already running) is charged to the restart limits
+    try:
+        started = start_restart(exp.exp_key, before_start=partial(enforce, 'restart', request.user.pk, exp.exp_key))
+    except RateLimited as limited:
+        return limited.response()
+    if started:
+        # Restart runs in the background; the UI may still be coming up
+        audit.record('restart_requested', user=request.user, exp_key=exp.exp_key, booking=booking)
+        logger.info("Restart triggered for booking %s (user: %s)", booking_id, request.user.username)
     
     # Redirect to experiment UI
     return redirect(exp.full_url)
@@ -192,14 +194,25 @@ def cancel_booking(request, booking_id):
     if booking.start_time <= now:
         return HttpResponseBadRequest("Cannot cancel an active or past session.")
     
-    booking.status = 'cancelled'
-    booking.save()
-    logger.info("Booking %s cancelled by user %s", booking_id, request.user.username)
+    # Freed interval goes straight to the waitlist inside the same write
+    try:
+        with get_coordinator().lock(f"booking:{booking.experiment.exp_key}"):
+            assigned = run_write(cancel_and_reassign, booking)
+    except LockTimeout:
+        return _booking_busy()
+    if assigned is None:
+        # Already cancelled (double submit or replayed POST); nothing changed
+        return redirect('accounts:booking_dashboard')
+    audit.record('booking_cancelled', user=request.user, exp_key=booking.experiment.exp_key, booking=booking)
+    audit.record_waitlist_bookings(assigned)
+    logger.info("Booking %s cancelled by user %s (%d waitlist assignments)",
+                booking_id, request.user.username, len(assigned))
     
     return redirect('accounts:booking_dashboard')
 
 
 @login_required
+@rate_limit('slots')
 def get_available_slots(request):
     """API endpoint to return available slots for an experiment (JSON)."""
     exp_key = request.GET.get('exp')
@@ -211,74 +224,61 @@ def get_available_slots(request):
     
     experiment = get_object_or_404(Experiment, exp_key=exp_key)
     
-    # Parse target date
-    if date_str:
-        try:
-            target_date = timezone.datetime.strptime(date_str, '%Y-%m-%d').date()
-            # Start from beginning of target date or now, whichever is later
-            start_of_day = timezone.make_aware(timezone.datetime.combine(target_date, timezone.datetime.min.time()))
-            current = max(start_of_day, timezone.now())
-        except ValueError:
-            current = timezone.now()
-    else:
-        current = timezone.now()
-    
-    # Round up to nearest 5 minutes for cleaner slots
-    current = current + timedelta(minutes=5 - (current.minute % 5))
-    
-    # Generate available slots
-    slots = []
-    max_iterations = 50  # Prevent infinite loops
-    
-    for _ in range(max_iterations):
-        slot_end = current + timedelta(minutes=duration)
-        
-        # Check if slot overlaps with existing bookings
-        conflict = experiment.bookings.filter(
-            status='active',
-            start_time__lt=slot_end,
-            end_time__gt=current
-        ).exists()
-        
-        # Check if it's the user's own booking
-        user_booking = experiment.bookings.filter(
-            user=request.user,
-            status='active',
-            start_time__lt=slot_end,
-            end_time__gt=current
-        ).first()
-        
-        if user_booking:
-            slots.append({
-                'start': current.isoformat(),
-                'end': slot_end.isoformat(),
-                'display': timezone.localtime(current).strftime('%H:%M'),
-                'status': 'my_booking'
-            })
-        elif conflict:
-            slots.append({
-                'start': current.isoformat(),
-                'end': slot_end.isoformat(),
-                'display': timezone.localtime(current).strftime('%H:%M'),
-                'status': 'booked'
-            })
-        else:
-            slots.append({
-                'start': current.isoformat(),
-                'end': slot_end.isoformat(),
-                'display': timezone.localtime(current).strftime('%H:%M'),
-                'status': 'available'
-            })
-        
-        # Move to next slot
-        current = current + timedelta(minutes=30)
-        
-        # Stop if we have enough slots or moved to next day
-        if len(slots) >= 20:
-            break
+    current = slot_window_start(date_str)
+    bookings = overlapping_bookings(experiment, current, duration)
+    slots = build_slots(current, duration, bookings, request.user.id)
+    mark_held_slots(slots, exp_key, current, duration, request.user.id)
     
     return JsonResponse({'slots': slots})
 
+@login_required
+@require_GET
+@rate_limit('slots')
+def find_next_slots(request):
+    """API endpoint returning the k earliest free intervals across experiments (JSON).
+
+    Query params: duration (minutes), from/to (ISO datetimes, default now..+7d),
+    k (max results) and an optional repeated exp filter.
+    """
+    try:
+        duration = timedelta(minutes=int(request.GET.get('duration', 60)))
+        k = min(int(request.GET.get('k', 5)), 50)
+        window_start = _parse_aware(request.GET.get('from')) or timezone.now()
+        window_end = _parse_aware(request.GET.get('to')) or window_start + timedelta(days=7)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid duration, k, from or to'}, status=400)
+    
+    if duration <= timedelta(0) or k <= 0 or window_end <= window_start:
+        return JsonResponse({'error': 'Empty search window'}, status=400)
+    
+    window_start = max(window_start, timezone.now())
+    # Round up to the next 5-minute mark for cleaner slots
+    rounded = window_start.replace(second=0, microsecond=0)
+    if rounded != window_start or rounded.minute % 5:
+        rounded += timedelta(minutes=5 - rounded.minute % 5)
+    window_start = rounded
+    
+    experiments = Experiment.objects.all()
+    exp_keys = request.GET.getlist('exp')
+    if exp_keys:
+        experiments = experiments.filter(exp_key__in=exp_keys)
+    
+    experiments = list(experiments)
+    # Slots someone is holding would be refused by hold_slot and book_session
+    held = {exp.exp_key: held_intervals(exp.exp_key, window_start, window_end) for exp in experiments}
+    indexes = build_gap_indexes(experiments, window_start, window_end, held=held)
+    return JsonResponse({'slots': earliest_fits(indexes, duration, k)})
+
+
+def _parse_aware(value):
+    """Parse an ISO datetime query param, assuming the current timezone if naive."""
+    if not value:
+        return None
+    parsed = timezone.datetime.fromisoformat(value)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
 @login_required
 @require_POST
 def trigger_service(request):
@@ -288,19 +288,82 @@ def trigger_service(request):
         return HttpResponseBadRequest("Invalid experiment selection.")
 
     entry = _SERVICE_MAP[exp]
-    script_rel = entry.get("script")
-    script_path = os.path.join(settings.BASE_DIR, script_rel) if script_rel else None
 
-    if script_path and os.path.exists(script_path) and os.access(script_path, os.X_OK):
-        logger.info("User %s triggered restart for %s (script: %s)", request.user.username, exp, script_path)
-        _run_script_async(script_path)
+    # Only a restart that really starts (not one already running) is charged to the restart limits
+    try:
+        started = start_restart(exp, before_start=partial(enforce, 'restart', request.user.pk, exp))
+    except RateLimited as limited:
+        return limited.response()
+    if started:
+        audit.record('restart_requested', user=request.user, exp_key=exp)
+        logger.info("User %s triggered restart for %s", request.user.username, exp)
     else:
-        logger.warning("Restart script missing or not executable for %s: %s", exp, script_path)
+        logger.warning("No restart plan and restart script missing or not executable for %s: %s", exp, entry.get("script"))
 
     return redirect(entry["url"])
 
+def _has_conflict(experiment, start_time, end_time):
+    """True if an active booking of experiment overlaps [start_time, end_time)."""
+    return experiment.bookings.filter(
+        status='active',
+        start_time__lt=end_time,
+        end_time__gt=start_time
+    ).exists()
+
+
+def _booking_busy():
+    return HttpResponse("Bookings for this testbed are busy, please try again.", status=503)
+
+
+def _create_booking(user, experiment, start_time, end_time):
+    """Create an active booking unless it overlaps an existing one; return None on conflict."""
+    if _has_conflict(experiment, start_time, end_time):
+        return None
+    
+    return SessionBooking.objects.create(
+        user=user,
+        experiment=experiment,
+        start_time=start_time,
+        end_time=end_time,
+        status='active'
+    )
+
+
+@login_required
+@require_POST
+@rate_limit('booking')
+def hold_slot(request):
+    """Place a short-lived hold on a slot while the user confirms the booking (JSON)."""
+    exp_key = request.POST.get('exp')
+    duration = int(request.POST.get('duration', 60))
+    
+    experiment = get_object_or_404(Experiment, exp_key=exp_key)
+    
+    try:
+        start_time = _parse_aware(request.POST.get('start_time'))
+    except ValueError:
+        start_time = None
+    if start_time is None or start_time < timezone.now():
+        return JsonResponse({'error': 'Invalid start_time'}, status=400)
+    
+    end_time = start_time + timedelta(minutes=duration)
+    # Same lock as booking writes, so no booking can commit between the check and the claim
+    try:
+        with get_coordinator().lock(f"booking:{exp_key}"):
+            if _has_conflict(experiment, start_time, end_time):
+                return JsonResponse({'error': 'Time slot is already booked.'}, status=409)
+            token = place_hold(request.user.id, exp_key, start_time, end_time)
+    except LockTimeout:
+        return _booking_busy()
+    if token is None:
+        return JsonResponse({'error': 'Time slot is held by another user.'}, status=409)
+    
+    return JsonResponse({'hold': token, 'expires_in': hold_seconds()})
+
+
 @login_required
 @require_POST
+@rate_limit('booking')
 def book_session(request):
     """Book a session for an experiment with custom duration."""
     exp_key = request.POST.get('exp')
@@ -313,47 +376,94 @@ def book_session(request):
     experiment = get_object_or_404(Experiment, exp_key=exp_key)
     
     try:
-        logger.info(f"Received start_time_str: {start_time_str}")
+        logger.debug("Received start_time_str: %s", start_time_str)
         start_time = timezone.datetime.fromisoformat(start_time_str)
-        logger.info(f"Parsed start_time: {start_time}, is_naive: {timezone.is_naive(start_time)}, tzinfo: {start_time.tzinfo}")
+        logger.debug("Parsed start_time: %s, tzinfo: %s", start_time, start_time.tzinfo)
         # Only make aware if the datetime is truly naive (no timezone info)
         # fromisoformat() returns timezone-aware datetime if the string includes timezone
         if timezone.is_naive(start_time):
             start_time = timezone.make_aware(start_time)
-            logger.info(f"After make_aware: {start_time}, tzinfo: {start_time.tzinfo}")
+            logger.debug("After make_aware: %s, tzinfo: %s", start_time, start_time.tzinfo)
     except ValueError as e:
-        logger.error(f"Failed to parse start_time: {start_time_str}, error: {e}")
+        logger.warning("Failed to parse start_time: %s, error: %s", start_time_str, e)
         return HttpResponseBadRequest("Invalid start_time format.")
     
     end_time = start_time + timedelta(minutes=duration)
-    logger.info(f"Booking: start={start_time}, end={end_time}, duration={duration}min")
+    logger.debug("Booking: start=%s, end=%s, duration=%dmin", start_time, end_time, duration)
     now = timezone.now()
     
     # Validate: cannot book in the past
     if start_time < now:
         return HttpResponseBadRequest("Cannot book in the past.")
     
-    # Validate: no overlap with existing bookings
-    conflict = experiment.bookings.filter(
-        status='active',
-        start_time__lt=end_time,
-        end_time__gt=start_time
-    ).exists()
-    
-    if conflict:
+    # Hold check, conflict check and insert commit under the experiment's lock, so no
+    # request in any worker process can pass the same checks in between. The conflict
+    # query runs even for the hold's owner: waitlist assignment and staff edits don't
+    # look at holds, so a hold alone doesn't prove the slot is still free.
+    try:
+        with get_coordinator().lock(f"booking:{exp_key}"):
+            held = owns_hold(request.user.id, exp_key, start_time, end_time)
+            if not held and held_by_others(exp_key, start_time, end_time, request.user.id):
+                return HttpResponseBadRequest("Time slot is held by another user.")
+            booking = run_write(_create_booking, request.user, experiment, start_time, end_time)
+    except LockTimeout:
+        return _booking_busy()
+    
+    if booking is None:
         return HttpResponseBadRequest("Time slot is already booked.")
     
-    # Create booking
-    booking = SessionBooking.objects.create(
+    release_hold(request.user.id)
+    audit.record('booking_created', user=request.user, exp_key=exp_key, booking=booking,
+                 start=start_time.isoformat(), end=end_time.isoformat(), held=held)
+    logger.info("User %s booked %s from %s to %s (%d min)", 
+                request.user.username, exp_key, start_time, end_time, duration)
+    
+    return redirect('accounts:booking_dashboard')
+
+
+@login_required
+@require_POST
+def join_waitlist(request):
+    """Queue the user for the first freed interval of an experiment in a time window."""
+    exp_key = request.POST.get('exp')
+    duration = int(request.POST.get('duration', 60))
+    
+    experiment = get_object_or_404(Experiment, exp_key=exp_key)
+    
+    try:
+        window_start = _parse_aware(request.POST.get('window_start'))
+        window_end = _parse_aware(request.POST.get('window_end'))
+    except ValueError:
+        return HttpResponseBadRequest("Invalid window format.")
+    
+    if not window_start or not window_end:
+        return HttpResponseBadRequest("Missing window_start or window_end.")
+    
+    if duration <= 0 or window_start + timedelta(minutes=duration) > window_end or window_end <= timezone.now():
+        return HttpResponseBadRequest("Window cannot fit the requested duration.")
+    if window_end - window_start > max_window():
+        return HttpResponseBadRequest("Waitlist window is too long.")
+    
+    entry = WaitlistEntry.objects.create(
         user=request.user,
         experiment=experiment,
-        start_time=start_time,
-        end_time=end_time,
-        status='active'
+        window_start=window_start,
+        window_end=window_end,
+        duration=duration,
     )
+    logger.info("User %s joined waitlist %s for %s", request.user.username, entry.id, exp_key)
     
-    logger.info("User %s booked %s from %s to %s (%d min)", 
-                request.user.username, exp_key, start_time, end_time, duration)
+    return redirect('accounts:booking_dashboard')
+
+
+@login_required
+@require_POST
+def leave_waitlist(request, entry_id):
+    """Remove the user's waiting entry from the queue."""
+    entry = get_object_or_404(WaitlistEntry, id=entry_id, user=request.user, status='waiting')
+    entry.status = 'cancelled'
+    entry.save(update_fields=['status'])
+    logger.info("User %s left waitlist %s", request.user.username, entry_id)
     
     return redirect('accounts:booking_dashboard')
 
@@ -378,3 +488,123 @@ def add_experiment(request):
                 messages.error(request, f'{field}: {error}')
     
     return redirect('accounts:home')
+
+
+@require_GET
+def health(request):
+    """Liveness probe for load balancers and process managers."""
+    return JsonResponse({'status': 'ok'})
+
+
+@require_GET
+def readiness(request):
+    """Readiness probe: 503 until this worker can reach the database and cache."""
+    checks = {}
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        checks['database'] = 'ok'
+    except Exception as e:
+        checks['database'] = str(e)
+    try:
+        cache.set('readiness-probe', 1, 5)
+        checks['cache'] = 'ok' if cache.get('readiness-probe') == 1 else 'unavailable'
+    except Exception as e:
+        checks['cache'] = str(e)
+    ready = all(v == 'ok' for v in checks.values())
+    return JsonResponse({'status': 'ready' if ready else 'unavailable', 'checks': checks}, status=200 if ready else 503)
+
+
+@login_required
+@require_GET
+def service_status(request):
+    """Report reachability and last restart state of every mapped testbed (restart details for staff)."""
+    reachable = probe_services()
+    return JsonResponse({
+        'services': {k: service_status_payload(k, r, detail=request.user.is_staff) for k, r in reachable.items()},
+    })
+
+
+@login_required
+@require_GET
+def avatar(request, digest, size, ext):
+    """Serve a profile picture thumbnail, rendering it on first request.
+
+    If the thumbnail can't be rendered in time the full-size picture is sent
+    instead (not cached, so the thumbnail is used once it exists).
+    """
+    size = int(size)
+    if size not in AVATAR_SIZES or ext not in AVATAR_FORMATS:
+        raise Http404("Unknown avatar variant.")
+    
+    path = variant_path(digest, size, ext)
+    if not os.path.exists(path):
+        source = image_source_path(digest)
+        if not os.path.exists(source):
+            raise Http404("No such profile picture.")
+        try:
+            path = ensure_variant(source, digest, size, ext).result(timeout=10)
+        except TimeoutError:
+            logger.warning("Rendering avatar %s/%s.%s timed out, sending the original", digest, size, ext)
+            response = FileResponse(open(source, 'rb'), content_type='image/jpeg')
+            response['Cache-Control'] = 'private, no-cache'
+            return response
+        except RENDER_ERRORS:
+            logger.exception("Could not render avatar %s/%s.%s", digest, size, ext)
+            raise Http404("Unreadable profile picture.")
+    
+    response = FileResponse(open(path, 'rb'), content_type=AVATAR_FORMATS[ext][1])
+    # URL embeds the picture's content hash, so the bytes behind it never change;
+    # private because the view needs a login, so shared caches must not keep it
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+
+@staff_member_required
+@require_GET
+def audit_events(request):
+    """Query the audit trail (staff only, JSON).
+
+    Filters: ``user`` (username or id), ``exp``, ``kind``, ``since`` and
+    ``until`` (ISO datetimes, until exclusive); newest first, at most
+    ``limit`` events. Pass the returned ``next_cursor`` as ``cursor`` for the
+    next page; it is a (created_at, id) keyset, so events sharing a timestamp
+    are neither skipped nor repeated. Events reach the table within
+    AUDIT_FLUSH_SECONDS.
+    """
+    events = AuditEvent.objects.all()
+    
+    user = request.GET.get('user')
+    if user:
+        user_id = int(user) if user.isdigit() else User.objects.filter(username=user).values_list('id', flat=True).first()
+        events = events.filter(user_id=user_id) if user_id is not None else events.none()
+    if request.GET.get('exp'):
+        events = events.filter(exp_key=request.GET['exp'])
+    if request.GET.get('kind'):
+        events = events.filter(kind=request.GET['kind'])
+    try:
+        since = _parse_aware(request.GET.get('since'))
+        until = _parse_aware(request.GET.get('until'))
+        limit = min(max(int(request.GET.get('limit', 100)), 1), 1000)
+        cursor = request.GET.get('cursor')
+        if cursor:
+            cursor_at, _, cursor_id = cursor.rpartition('|')
+            cursor_at, cursor_id = timezone.datetime.fromisoformat(cursor_at), int(cursor_id)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid since, until, limit or cursor'}, status=400)
+    if since:
+        events = events.filter(created_at__gte=since)
+    if until:
+        events = events.filter(created_at__lt=until)
+    if cursor:
+        events = events.filter(Q(created_at__lt=cursor_at) | Q(created_at=cursor_at, id__lt=cursor_id))
+    
+    rows = list(events.order_by('-created_at', '-id').values(
+        'id', 'created_at', 'kind', 'user_id', 'exp_key', 'booking_id', 'data'
+    )[:limit])
+    last = rows[-1] if len(rows) == limit else None
+    return JsonResponse({
+        'events': rows,
+        # isoformat() keeps microseconds, which JSON encoding of the datetime would drop
+        'next_cursor': f"{last['created_at'].isoformat()}|{last['id']}" if last else None,
+    })
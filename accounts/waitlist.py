@@ -0,0 +1,136 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .holds import held_intervals
+from .models import SessionBooking, WaitlistEntry
+from .notifications import enqueue
+
+logger = logging.getLogger(__name__)
+
+
+def max_window():
+    """Longest waitlist window a user may ask for; bounds the matcher's index probe."""
+    return timedelta(hours=getattr(settings, 'WAITLIST_MAX_WINDOW_HOURS', 24))
+
+
+def _best_waiter(experiment, free_start, free_end):
+    """Return (entry, slot_start) for the best-fitting entry, or (None, None).
+
+    Best fit is the longest requested duration that fits the interval
+    (least time left idle), oldest entry first among equals. Only entries
+    whose window overlaps the interval can fit, and since windows are at
+    most ``max_window()`` long, those all have window_start in
+    (free_start - max_window, free_end): one range probe on
+    ``waitlist_window_idx`` (experiment, status, window_start), however long
+    the queue is for other times.
+    """
+    max_minutes = int((free_end - free_start).total_seconds() // 60)
+    candidates = WaitlistEntry.objects.filter(
+        experiment=experiment,
+        status='waiting',
+        window_start__gt=free_start - max_window(),
+        window_start__lt=free_end,
+        window_end__gt=free_start,
+        duration__lte=max_minutes,
+    ).order_by().only('id', 'user_id', 'window_start', 'window_end', 'duration', 'created_at')
+
+    best = None
+    for entry in candidates:
+        slot_start = max(entry.window_start, free_start)
+        if slot_start + timedelta(minutes=entry.duration) > min(entry.window_end, free_end):
+            continue
+        key = (-entry.duration, entry.created_at)
+        if best is None or key < best[0]:
+            best = (key, entry, slot_start)
+    if best is None:
+        return None, None
+    return best[1], best[2]
+
+
+def _free_parts(experiment, start, end):
+    """Split [start, end) around active bookings and live holds, in start order.
+
+    Callers such as sweep_bookings compute their gaps outside the write
+    transaction, so the interval is re-checked here before anything is
+    assigned from it.
+    """
+    busy = list(SessionBooking.objects.filter(
+        experiment=experiment,
+        status='active',
+        start_time__lt=end,
+        end_time__gt=start,
+    ).values_list('start_time', 'end_time'))
+    busy += held_intervals(experiment.exp_key, start, end)
+    parts = []
+    cursor = start
+    for busy_start, busy_end in sorted(busy):
+        if busy_start > cursor:
+            parts.append((cursor, min(busy_start, end)))
+        cursor = max(cursor, busy_end)
+    if cursor < end:
+        parts.append((cursor, end))
+    return parts
+
+
+def release_interval(experiment, start, end):
+    """Hand a freed [start, end) interval of experiment to queued users.
+
+    Must run inside the transaction that freed the interval (see
+    ``accounts.db.run_write``) so no other request can grab it in between.
+    Only the parts of the interval not covered by an active booking or a
+    live hold are assigned, and leftover time on either side of an
+    assignment is offered to the next waiter. Returns the list of
+    WaitlistEntry objects that got a booking.
+    """
+    pending = _free_parts(experiment, max(start, timezone.now()), end)
+    assigned = []
+    while pending:
+        free_start, free_end = pending.pop()
+        if free_end <= free_start:
+            continue
+        entry, slot_start = _best_waiter(experiment, free_start, free_end)
+        if entry is None:
+            continue
+        slot_end = slot_start + timedelta(minutes=entry.duration)
+        entry.booking = SessionBooking.objects.create(
+            user_id=entry.user_id,
+            experiment=experiment,
+            start_time=slot_start,
+            end_time=slot_end,
+            status='active'
+        )
+        entry.status = 'assigned'
+        entry.save(update_fields=['booking', 'status'])
+        enqueue('waitlist_assigned', entry.booking)
+        assigned.append(entry)
+        logger.info("Waitlist entry %s assigned %s from %s to %s", entry.id, experiment.exp_key, slot_start, slot_end)
+        pending.append((free_start, slot_start))
+        pending.append((slot_end, free_end))
+    return assigned
+
+
+def cancel_and_reassign(booking):
+    """Cancel booking and offer its interval to the waitlist in the same transaction.
+
+    Returns the assigned WaitlistEntry objects, or None if the booking was
+    no longer active (a repeated cancel must not release the interval twice).
+    """
+    if not SessionBooking.objects.filter(id=booking.id, status='active').update(status='cancelled'):
+        return None
+    booking.status = 'cancelled'
+    enqueue('cancelled', booking)
+    return release_interval(booking.experiment, booking.start_time, booking.end_time)
+
+
+def expire_stale_entries(now=None):
+    """Mark waiting entries whose remaining window can no longer hold their duration as expired."""
+    now = now or timezone.now()
+    stale = [
+        entry.id
+        for entry in WaitlistEntry.objects.filter(status='waiting').only('id', 'window_end', 'duration').iterator()
+        if now + timedelta(minutes=entry.duration) > entry.window_end
+    ]
+    return WaitlistEntry.objects.filter(id__in=stale, status='waiting').update(status='expired')
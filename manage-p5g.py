@@ -1,10 +1,13 @@
 import os
+import sys
 import fcntl
 import socket
 import struct
-from django.core.management import execute_from_command_line
+import argparse
+import subprocess
 
 INTERFACE = "deibr0"   # your interface name
+PORT = 8000
 
 def get_interface_ip(ifname):
     """Return the IPv4 address assigned to a specific interface."""
@@ -20,15 +23,80 @@ def get_interface_ip(ifname):
     except OSError:
         return None
 
+def parse_args():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Run the 5G lab portal on the lab interface.")
+    parser.add_argument("--interface", default=INTERFACE)
+    parser.add_argument("--bind", help="IP to bind instead of the interface address")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--dev", action="store_true", help="Django's single-process runserver (old behaviour)")
+    parser.add_argument("--asgi", action="store_true", help="Serve project_login.asgi with async views")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: 2*CPU+1 for WSGI, CPU for ASGI)")
+    parser.add_argument("--threads", type=int, default=4, help="Threads per WSGI worker")
+    parser.add_argument("--max-requests", type=int, default=1000, help="Recycle a worker after this many requests")
+    args = parser.parse_args()
+    if args.workers is None:
+        args.workers = cpus if args.asgi else 2 * cpus + 1
+    return args
+
+def gunicorn_argv(ip, args):
+    """Build the gunicorn command line for the pre-fork worker pool."""
+    app = "project_login.asgi:application" if args.asgi else "project_login.wsgi:application"
+    argv = [
+        sys.executable, "-m", "gunicorn", app,
+        "--bind", f"{ip}:{args.port}",
+        "--workers", str(args.workers),
+        # Recycle workers to cap slow leaks; jitter keeps them from restarting together
+        "--max-requests", str(args.max_requests),
+        "--max-requests-jitter", str(max(1, args.max_requests // 10)),
+        # SIGHUP reloads code by replacing workers once in-flight requests finish
+        "--graceful-timeout", "30",
+        "--timeout", "120",
+        "--access-logfile", "-",
+        # Starts manage.py restart_worker and keeps restarts out of recycled workers
+        "--config", "python:project_login.gunicorn_hooks",
+    ]
+    if args.asgi:
+        argv += ["--worker-class", "uvicorn.workers.UvicornWorker"]
+    else:
+        argv += ["--worker-class", "gthread", "--threads", str(args.threads)]
+    return argv
+
 if __name__ == "__main__":
     os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project_login.settings")
+    args = parse_args()
 
-    ip = get_interface_ip(INTERFACE)
+    ip = args.bind or get_interface_ip(args.interface)
 
     if not ip:
-        print(f"❌ Could not find IP for interface: {INTERFACE}")
+        print(f"❌ Could not find IP for interface: {args.interface}")
         exit(1)
 
-    print(f"🚀 Starting Django on interface {INTERFACE} → {ip}:8000")
-
-    execute_from_command_line(["manage.py", "runserver", f"{ip}:8000"])
+    if args.dev:
+        from django.core.management import execute_from_command_line
+        print(f"🚀 Starting Django on interface {args.interface} → {ip}:{args.port}")
+        execute_from_command_line(["manage.py", "runserver", f"{ip}:{args.port}"])
+    else:
+        if args.asgi:
+            os.environ["ASYNC_VIEWS"] = "1"
+        # Concurrent workers need WAL and IMMEDIATE transactions (see settings.SQLITE_PROFILE)
+        os.environ.setdefault("SQLITE_PROFILE", "production")
+        # Restarts run in manage.py restart_worker, not in web workers that get recycled
+        os.environ.setdefault("RESTART_RUNNER", "worker")
+        # Rate limits and cached state must be shared by all workers, not kept per process
+        os.environ.setdefault("RATE_LIMIT_BACKEND", "coordination")
+        os.environ.setdefault("CACHE_BACKEND", "file")
+        # gunicorn doesn't serve static files; WhiteNoise serves what collectstatic gathers
+        try:
+            import whitenoise  # noqa: F401
+        except ImportError:
+            print("⚠️  whitenoise is not installed: static files and the admin's CSS won't be served "
+                  "(pip install whitenoise, or serve STATIC_ROOT from a front-end proxy)")
+        subprocess.run([sys.executable, "manage.py", "collectstatic", "--noinput", "-v0"],
+                       cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        mode = "ASGI" if args.asgi else "WSGI"
+        print(f"🚀 Starting {args.workers} {mode} workers on {ip}:{args.port} "
+              f"(reload: kill -HUP {os.getpid()}, ready: /accounts/api/ready/)")
+        # exec so gunicorn's master keeps this PID and receives signals directly
+        argv = gunicorn_argv(ip, args)
+        os.execv(argv[0], argv)
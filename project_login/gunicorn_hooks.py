@@ -0,0 +1,44 @@
+"""gunicorn server hooks used by manage-p5g.py (``--config python:project_login.gunicorn_hooks``).
+
+With ``RESTART_RUNNER=worker`` (the launcher's default) testbed restarts run
+in a separate ``manage.py restart_worker`` process started next to the web
+workers, so recycling a web worker (``--max-requests``, ``kill -HUP``) never
+cuts a restart short. The restart worker is not reloaded by HUP; restart
+the launcher to give it new code.
+"""
+import logging
+import os
+import subprocess
+import sys
+
+logger = logging.getLogger('gunicorn.error')
+
+_restart_worker = None
+
+
+def on_starting(server):
+    global _restart_worker
+    if os.environ.get('RESTART_RUNNER') == 'worker':
+        manage = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'manage.py')
+        _restart_worker = subprocess.Popen([sys.executable, manage, 'restart_worker'])
+        logger.info("Started restart worker (pid %s)", _restart_worker.pid)
+
+
+def on_exit(server):
+    if _restart_worker is not None and _restart_worker.poll() is None:
+        # restart_worker lets running restarts finish before it exits
+        _restart_worker.terminate()
+        try:
+            _restart_worker.wait(timeout=server.cfg.graceful_timeout)
+        except subprocess.TimeoutExpired:
+            logger.warning("Restart worker still finishing restarts; leaving it to exit on its own")
+
+
+def worker_exit(server, worker):
+    """With RESTART_RUNNER=inline, let restarts running in this worker finish before it exits."""
+    try:
+        from accounts.services import wait_for_restarts
+    except Exception:  # the app never loaded in this worker
+        return
+    if not wait_for_restarts(server.cfg.graceful_timeout):
+        logger.warning("Worker %s exiting with restarts still running", worker.pid)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -50,6 +51,15 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# gunicorn (manage-p5g.py) doesn't serve static files the way runserver does;
+# WhiteNoise serves the collectstatic output (STATIC_ROOT) when installed.
+try:
+    import whitenoise  # noqa: F401
+except ImportError:
+    pass
+else:
+    MIDDLEWARE.insert(1, 'whitenoise.middleware.WhiteNoiseMiddleware')
+
 ROOT_URLCONF = 'project_login.urls'
 
 TEMPLATES = [
@@ -69,11 +79,38 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'project_login.wsgi.application'
+ASGI_APPLICATION = 'project_login.asgi.application'
+
+# Route the slots/restart/status endpoints to accounts.async_views.
+# Only enable when serving project_login.asgi with an ASGI server (uvicorn, daphne).
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '') == '1'
+
+# Point every testbed UI at this URL instead of the lab network (local stand-ins,
+# manage.py bench_concurrency). Leave unset in production.
+TESTBED_URL_OVERRIDE = os.environ.get('TESTBED_URL_OVERRIDE')
+
+# How long /accounts/api/status/ reuses testbed probe results (in the shared cache).
+# 0 probes on every request.
+SERVICE_PROBE_CACHE_SECONDS = int(os.environ.get('SERVICE_PROBE_CACHE_SECONDS', 5))
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLITE_PROFILE=production enables WAL and connection reuse so concurrent
+# bookings don't hit "database is locked"; manage-p5g.py sets it for the worker
+# pool. The default (dev) keeps Django's stock SQLite behaviour, so manage.py
+# commands don't switch the database file's journal mode to WAL.
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'dev')
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',          # readers never block the writer
+    'synchronous': 'NORMAL',        # safe with WAL, avoids an fsync per commit
+    'busy_timeout': 5000,           # ms to wait for the write lock
+    'mmap_size': 134217728,         # 128 MiB memory-mapped reads
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
@@ -81,6 +118,135 @@ DATABASES = {
     }
 }
 
+if SQLITE_PROFILE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {k}={v}' for k, v in SQLITE_PRAGMAS.items()),
+            # Take the write lock at BEGIN so writers queue on busy_timeout
+            # instead of failing on a read-to-write lock upgrade.
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 5,
+        },
+    })
+
+# Funnel booking writes through a single writer thread (accounts.db.run_write)
+SQLITE_WRITE_QUEUE = os.environ.get('SQLITE_WRITE_QUEUE', '') == '1'
+
+
+# Cache
+# LocMemCache is per process; CACHE_BACKEND=file (set by manage-p5g.py) shares
+# one FileBasedCache between the worker processes of this host.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'lab-default',
+    }
+}
+if os.environ.get('CACHE_BACKEND') == 'file':
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'run' / 'cache',
+    }
+
+# Locks, leases and cross-worker invalidation (accounts.coordination). 'file' works for
+# any number of workers on one host; for several hosts use
+# {'BACKEND': 'redis', 'URL': 'redis://...'} ('URL': 'local://' is an in-process stand-in).
+COORDINATION = {
+    'BACKEND': os.environ.get('COORDINATION_BACKEND', 'file'),
+    'PATH': BASE_DIR / 'run' / 'coordination',
+    'URL': os.environ.get('COORDINATION_URL', 'redis://localhost:6379/0'),
+}
+
+# A testbed restart still running after this long is stopped. Runners renew
+# their lease every few seconds, so a killed one frees the testbed quickly.
+RESTART_LEASE_SECONDS = 900
+
+# 'inline' runs restarts in the web process that requested them (runserver);
+# 'worker' queues them for manage.py restart_worker, which manage-p5g.py
+# starts next to the gunicorn workers.
+RESTART_RUNNER = os.environ.get('RESTART_RUNNER', 'inline')
+
+# Seconds a slot stays held after a user picks it in the booking dashboard
+SLOT_HOLD_SECONDS = 180
+
+# Longest time window a user can wait for; keeps the waitlist matcher's index probe bounded
+WAITLIST_MAX_WINDOW_HOURS = 24
+
+# manage.py prewarm_testbeds restarts a testbed this many minutes before a booking;
+# a booking starting within PREWARM_BACK_TO_BACK_MINUTES of the same user's previous
+# one on that testbed reuses the running environment instead.
+PREWARM_LEAD_MINUTES = 10
+PREWARM_BACK_TO_BACK_MINUTES = 5
+
+# manage.py send_notifications emails reminders this many minutes before a booking,
+# plus cancellation/waitlist notices, NOTIFICATION_BATCH_SIZE messages per
+# send_messages call over one SMTP connection. For local testing run
+# `python -m aiosmtpd -n -l localhost:1025` and set EMAIL_PORT=1025, or set
+# EMAIL_BACKEND=django.core.mail.backends.console.EmailBackend to print them.
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 25))
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', '5G Lab <noreply@localhost>')
+REMINDER_LEAD_MINUTES = 30
+NOTIFICATION_BATCH_SIZE = 100
+NOTIFICATION_MAX_ATTEMPTS = 5
+
+
+# Rate limits (accounts.ratelimit): "N/period" lets N requests burst, refilling
+# at N per period, per user / per exp_key / for the endpoint as a whole.
+# 'local' buckets are per process, so with N workers each limit is N times
+# looser; 'coordination' (set by manage-p5g.py) shares them through COORDINATION.
+RATE_LIMITS = {
+    'restart': {'user': '3/m', 'exp': '6/m'},
+    'booking': {'user': '20/m', 'all': '100/s'},
+    'slots': {'user': '120/m'},
+}
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'local')
+
+
+# Audit trail
+# Audit events (accounts.audit) are buffered and bulk-inserted every
+# AUDIT_FLUSH_SECONDS or AUDIT_BATCH_SIZE events; batches that fail to insert
+# are kept as JSONL in AUDIT_SPILL_DIR until the next successful flush.
+AUDIT_FLUSH_SECONDS = 1.0
+AUDIT_BATCH_SIZE = 500
+AUDIT_SPILL_DIR = BASE_DIR / 'run' / 'audit'
+
+
+# Logging
+# Request threads only enqueue records; a background thread writes them as
+# JSON lines in batches (accounts.log). LOG_SAMPLING keeps that fraction of
+# sub-WARNING records from noisy loggers.
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+
+LOG_SAMPLING = {
+    'django.server': 0.1,   # runserver access lines
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'accounts.log.JsonFormatter'},
+    },
+    'handlers': {
+        'queue': {
+            '()': 'accounts.log.QueueingHandler',
+            'formatter': 'json',
+            'sampling': LOG_SAMPLING,
+        },
+    },
+    'root': {'handlers': ['queue'], 'level': LOG_LEVEL},
+    'loggers': {
+        'django': {'handlers': ['queue'], 'level': LOG_LEVEL, 'propagate': False},
+        'django.server': {'handlers': ['queue'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -123,6 +289,8 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+# manage-p5g.py runs collectstatic into here; WhiteNoise serves it under gunicorn
+STATIC_ROOT = BASE_DIR / 'run' / 'static'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -139,6 +307,9 @@ LOGOUT_REDIRECT_URL = 'intro'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploaded profile pictures are scaled so their longest side is at most this
+PROFILE_PIC_MAX_DIMENSION = 1024
+
 STATICFILES_DIRS = [
     BASE_DIR / 'static'
 ]